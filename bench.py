@@ -0,0 +1,240 @@
+"""
+Micro-benchmarks of the client side of the Weapon application.
+
+Run all the benchmarks with `python bench.py`, or some of them with `python bench.py wire ...`.
+The benchmarks only use synthetic data, no C# server is needed.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import threading
+import tracemalloc
+from model import Weapon
+import parallel_decode
+from rendering import WeaponRenderer
+import wire_format
+
+
+def make_weapons(count):
+    """
+    The function `make_weapons` builds `count` synthetic weapons that look like the inventory.
+    """
+    types = ("Rifle", "Pistol", "Shotgun", "Sniper", "Machine Gun")
+    manufacturers = ("Colt", "Beretta", "Glock", "Heckler & Koch", "FN Herstal", "IWI")
+    calibers = ("5.56mm", "9mm", "7.62mm", "12 gauge", ".45 ACP")
+    return [Weapon(i, f"Weapon {i}", types[i % len(types)], manufacturers[i % len(manufacturers)],
+                   calibers[i % len(calibers)], 10 + i % 40, 300 + i % 900, 100 + i % 500,
+                   f"https://images.example.com/weapons/{i}.jpg") for i in range(1, count + 1)]
+
+
+def best_of(function, repeat=5):
+    """
+    The function `best_of` returns the best wall time in seconds of `repeat` calls of `function`.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_wire(count):
+    """
+    The function `bench_wire` measures the bytes on the wire and the decode time (decompression
+    plus `Weapon` building) of the inventory for every format and compression.
+    """
+    weapons = make_weapons(count)
+    bodies = {
+        wire_format.JSON_TYPE: json.dumps(wire_format.encode_records(weapons)).encode("utf-8"),
+        wire_format.COLUMNS_TYPE: json.dumps(wire_format.encode_columns(weapons)).encode("utf-8"),
+    }
+    if wire_format.msgpack is not None:
+        bodies[wire_format.MSGPACK_TYPE + " (records)"] = wire_format.msgpack.packb(wire_format.encode_records(weapons))
+        bodies[wire_format.MSGPACK_TYPE + " (columns)"] = wire_format.msgpack.packb(wire_format.encode_columns(weapons))
+    encodings = ["identity", "gzip"] + (["br"] if wire_format.brotli is not None else [])
+
+    print(f"wire: {count} weapons")
+    print(f"  {'format':<48} {'encoding':<9} {'bytes':>11} {'decode ms':>10}")
+    for content_type, body in bodies.items():
+        for encoding in encodings:
+            wire = wire_format.compress(body, encoding)
+            media_type = content_type.split(" ")[0]
+            seconds = best_of(lambda: wire_format.decode_weapons(wire_format.decompress(wire, encoding), media_type))
+            print(f"  {content_type:<48} {encoding:<9} {len(wire):>11,} {seconds * 1000:>10.2f}")
+
+
+def format_row_before(weapon):
+    """
+    The function `format_row_before` formats a row the way the 'All Weapons' page did before the
+    rendering cache, as the reference of `bench_render`.
+    """
+    return (
+        f"<b>ID:</b> {weapon.Id}<br>"
+        f"<b>Name:</b> {weapon.Name}<br>"
+        f"<b>Type:</b> {weapon.Type}<br>"
+        f"<b>Manufacturer:</b> {weapon.Manufacturer}<br>"
+        f"<b>Caliber:</b> {weapon.Caliber}<br>"
+        f"<b>Magazine Capacity:</b> {weapon.MagazineCapacity}<br>"
+        f"<b>Fire Rate:</b> {weapon.FireRate}<br>"
+        f"<b>Ammo Count:</b> {weapon.AmmoCount}<br>"
+        f"<b>Image URL:</b> {weapon.Images}<br>"
+    )
+
+
+def bench_render(count):
+    """
+    The function `bench_render` measures the rows formatted per second for the 'All Weapons' page:
+    f-strings on every display (before), the renderer with an empty cache (first display) and the
+    renderer displaying the same list again (cached), with 1% of the weapons modified in between.
+    Like the presenter, a modified weapon is a new `Weapon` object.
+    """
+    weapons = make_weapons(count)
+    renderer = WeaponRenderer()
+
+    def display_again():
+        for index in range(0, len(weapons), 100):
+            weapons[index] = Weapon(**{**vars(weapons[index]), "AmmoCount": weapons[index].AmmoCount + 1})
+        for weapon in weapons:
+            renderer.row(weapon)
+
+    results = {
+        "before (f-strings)": best_of(lambda: [format_row_before(weapon) for weapon in weapons]),
+        "renderer, first display": best_of(lambda: (renderer.clear(), [renderer.row(weapon) for weapon in weapons])),
+        "renderer, display again": best_of(display_again),
+    }
+    print(f"render: {count} weapons")
+    for name, seconds in results.items():
+        print(f"  {name:<26} {count / seconds:>14,.0f} rows/s")
+
+
+def longest_stall(function, tick=0.001):
+    """
+    The function `longest_stall` calls `function` while another thread wakes up every `tick` seconds,
+    like the delivery of the signals to the GUI, and returns (wall time, longest time between two
+    wake-ups) in seconds: how long `function` kept the other threads from running.
+    """
+    stopped = threading.Event()
+    gaps = [0.0]
+
+    def ticker():
+        last = time.perf_counter()
+        while not stopped.wait(tick):
+            now = time.perf_counter()
+            gaps[0] = max(gaps[0], now - last)
+            last = now
+
+    thread = threading.Thread(target=ticker)
+    thread.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    stopped.set()
+    thread.join()
+    return seconds, gaps[0]
+
+
+def bench_decode(count):
+    """
+    The function `bench_decode` measures the decoding of the inventory as a JSON array in the calling
+    thread and in the process pool, and the longest time another thread could not run meanwhile.
+    """
+    body = json.dumps(wire_format.encode_records(make_weapons(count))).encode("utf-8")
+    workers = max(2, parallel_decode.WORKERS)
+    parallel_decode.decode_weapons_parallel(b"[]", workers)  # Start the pool
+    print(f"decode: {count} weapons, {len(body):,} bytes, {workers} processes")
+    for name, function in (("one thread", lambda: wire_format.decode_weapons(body, wire_format.JSON_TYPE)),
+                           ("process pool", lambda: parallel_decode.decode_weapons_parallel(body, workers))):
+        seconds, stall = longest_stall(function)
+        print(f"  {name:<14} {seconds * 1000:>10.1f} ms   longest stall {stall * 1000:>8.1f} ms")
+
+
+def bench_lifecycle(count, cycles=10, max_heap_growth=1024 * 1024):
+    """
+    The function `bench_lifecycle` is the headless regression check of the widget lifecycle: it
+    repeats load all / search / back cycles on a `WeaponView` (offscreen) and fails (exit status 1)
+    if the live widgets or the Python heap keep growing once the first cycles are done, or if
+    objects removed by a refresh survive it. The view neither probes the server nor reads the
+    inventory saved by the user: its cache directory is a temporary one.
+    """
+    try:
+        from PyQt5.QtCore import QCoreApplication, QEvent
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        print("lifecycle: skipped, PyQt5 is not installed")
+        return
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    cache_dir = tempfile.TemporaryDirectory(prefix="weapon-bench-")  # Removed at exit
+    os.environ["XDG_CACHE_HOME"] = cache_dir.name
+    app = QApplication.instance() or QApplication([])
+    from lifecycle import LifecycleTracker
+    from search_results import SearchHit
+    from view import WeaponView
+
+    count = min(count, 500)
+    weapons = make_weapons(count + count // 10)
+    hits = [SearchHit(rank, 1.0 / rank, {"name": weapon.Name, "type": weapon.Type})
+            for rank, weapon in enumerate(weapons[:count], start=1)]
+    view = WeaponView(probe_server=False)
+    tracker = view.lifecycle or LifecycleTracker(view)
+
+    def settle():
+        view.weapon_updates.flush()
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+        app.processEvents()
+
+    live_widgets, heap = [], []
+    for cycle in range(cycles):
+        # One cycle out of two, a tenth of the weapons are removed and others added
+        shift = (cycle % 2) * (count // 10)
+        view.show_all_weapons_page(weapons[shift:shift + count])
+        settle()
+        tracker.checkpoint("all_weapons")
+        view.show_search_page(cycle + 1, "weapon")
+        view.add_search_hits(cycle + 1, hits)
+        view.show_more_search_hits()
+        settle()
+        tracker.checkpoint("search")
+        view.show_main_page()
+        settle()
+        live_widgets.append(len(QApplication.allWidgets()))
+        heap.append(tracemalloc.get_traced_memory()[0])
+
+    # The first two cycles fill the caches, the same step of the next cycles must not grow
+    widget_growth = live_widgets[-1] - live_widgets[-3]
+    heap_growth = heap[-1] - heap[1]
+    print(f"lifecycle: {cycles} cycles of {count} weapons")
+    print(f"  live widgets per cycle: {live_widgets}")
+    print(f"  heap growth after warm-up: {heap_growth:,} bytes")
+    print(f"  objects surviving a refresh: {sum(tracker.survivors.values())}")
+    if widget_growth > 0 or heap_growth > max_heap_growth or tracker.survivors:
+        json.dump(tracker.report()["survivors"], sys.stdout, indent=2)
+        raise SystemExit("lifecycle: unbounded growth")
+
+
+# Every benchmark takes the number of weapons to use.
+BENCHMARKS = {
+    "wire": bench_wire,
+    "render": bench_render,
+    "decode": bench_decode,
+    "lifecycle": bench_lifecycle,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run among {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("-n", "--count", type=int, default=10000, help="number of weapons (default: 10000)")
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](args.count)
+
+
+if __name__ == "__main__":
+    main()
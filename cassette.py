@@ -0,0 +1,243 @@
+import atexit
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Record/replay of the HTTP traffic of the presenter, enabled by environment variables:
+#   WEAPON_CASSETTE=<path>                  the cassette file
+#   WEAPON_CASSETTE_MODE=record|replay      record the real traffic, or replay it offline (default)
+#   WEAPON_REPLAY_LATENCY_SCALE=<factor>    replayed latency / recorded latency (default 1, 0 = no wait)
+CASSETTE_ENV = "WEAPON_CASSETTE"
+MODE_ENV = "WEAPON_CASSETTE_MODE"
+LATENCY_SCALE_ENV = "WEAPON_REPLAY_LATENCY_SCALE"
+
+# Cassette file: gzip compressed JSON {"version", "recorded_at", "interactions": [...]}. Every
+# interaction is a request (method, url with sorted query, digest of the body) and either its response
+# (status, reason, headers, body, elapsed seconds) or the exception raised instead ("error").
+CASSETTE_VERSION = 1
+# Headers describing the body on the wire, dropped because the body is stored decompressed.
+TRANSFER_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+def request_key(request):
+    """
+    The function `request_key` identifies a request in a cassette: its method, its URL with the query
+    parameters sorted and the SHA-1 digest of its body. A streamed body is not read twice: it is
+    identified by its `digest` attribute if it has one (`MultipartUpload`), otherwise by 'stream'.
+    """
+    url = urlsplit(request.url)
+    url = urlunsplit(url._replace(query=urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))))
+    body = request.body or b""
+    if not isinstance(body, (bytes, str)):
+        return request.method, url, getattr(body, "digest", None) or "stream"
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return request.method, url, hashlib.sha1(body).hexdigest() if body else ""
+
+
+def _encode_body(content):
+    try:
+        return content.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode("ascii"), "base64"
+
+
+def _decode_body(body, encoding):
+    return base64.b64decode(body) if encoding == "base64" else body.encode("utf-8")
+
+
+# The class `RecordingStream` replaces the raw body of a response sent with `stream=True`: the body is
+# still read by chunks when the caller asks for it, and the chunks read are kept. Once the body is read
+# to the end or the response closed, `on_done` is called with the body.
+class RecordingStream:
+    def __init__(self, raw, on_done):
+        self._raw = raw
+        self._on_done = on_done
+        self._chunks = []
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt=None, *args, **kwargs):
+        data = self._raw.read(amt, *args, **kwargs)
+        self._chunks.append(data)
+        if amt is None or not data:
+            self._finish()
+        return data
+
+    def close(self):
+        self._raw.close()
+        self._finish()
+
+    def _finish(self):
+        if self._on_done is not None:
+            on_done, self._on_done = self._on_done, None
+            on_done(b"".join(self._chunks))
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+# The class `RecordingAdapter` sends the requests like the default transport of `requests` and keeps
+# every request with its response and the time it took, until `save` writes them to the cassette. The
+# body of a response is read at once, its download being part of the latency, except with
+# `stream=True`: it is then recorded as the caller reads it (`RecordingStream`).
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.interactions = []
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, **kwargs):
+        method, url, body_digest = request_key(request)
+        interaction = {"method": method, "url": url, "body_digest": body_digest}
+        start = time.perf_counter()
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+            if stream:
+                response.raw = RecordingStream(response.raw, lambda content: self._record(interaction, response, content, start))
+                return response
+            content = response.content
+        except requests.RequestException as e:
+            interaction.update(error=type(e).__name__, message=str(e), elapsed=time.perf_counter() - start)
+            with self._lock:
+                self.interactions.append(interaction)
+            raise
+        self._record(interaction, response, content, start)
+        return response
+
+    def _record(self, interaction, response, content, start):
+        body, body_encoding = _encode_body(content)
+        interaction.update(
+            status=response.status_code,
+            reason=response.reason,
+            headers={name: value for name, value in response.headers.items() if name.lower() not in TRANSFER_HEADERS},
+            body=body,
+            body_encoding=body_encoding,
+            elapsed=time.perf_counter() - start,
+        )
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def save(self):
+        """
+        The function `save` writes the recorded interactions to the cassette file, replacing it
+        atomically.
+        """
+        with self._lock:
+            cassette = {"version": CASSETTE_VERSION, "recorded_at": time.time(), "interactions": list(self.interactions)}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        with gzip.open(temporary_path, "wt", encoding="utf-8") as cassette_file:
+            json.dump(cassette, cassette_file, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
+
+
+# The class `ReplayAdapter` answers the requests from a cassette without any network access. A
+# request is matched by its method, URL and body, or by its method and URL only if no recorded body
+# matches. The responses recorded for the same request are replayed in order, the last one again
+# once they are used up. Every response waits its recorded latency multiplied by `latency_scale`.
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, path, latency_scale=1.0):
+        super().__init__()
+        self.path = path
+        self.latency_scale = latency_scale
+        with gzip.open(path, "rt", encoding="utf-8") as cassette_file:
+            cassette = json.load(cassette_file)
+        if cassette.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version in {path}: {cassette.get('version')}")
+        self._exact = {}
+        self._by_url = {}
+        for interaction in cassette["interactions"]:
+            key = (interaction["method"], interaction["url"], interaction["body_digest"])
+            self._exact.setdefault(key, deque()).append(interaction)
+            self._by_url.setdefault(key[:2], deque()).append(interaction)
+        self.replayed = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+
+    def _next_interaction(self, key):
+        with self._lock:
+            interactions = self._exact.get(key) or self._by_url.get(key[:2])
+            if not interactions:
+                self.missed += 1
+                return None
+            self.replayed += 1
+            return interactions.popleft() if len(interactions) > 1 else interactions[0]
+
+    def send(self, request, **kwargs):
+        key = request_key(request)
+        interaction = self._next_interaction(key)
+        if interaction is None:
+            raise requests.ConnectionError(f"No recorded response for {key[0]} {key[1]} in {self.path}", request=request)
+        if self.latency_scale > 0:
+            time.sleep(interaction["elapsed"] * self.latency_scale)
+        if "error" in interaction:
+            error = getattr(requests.exceptions, interaction["error"], requests.ConnectionError)
+            raise error(interaction["message"], request=request)
+
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction["reason"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = _decode_body(interaction["body"], interaction["body_encoding"])
+        # The body is already read: `iter_content` replays it by chunks, `close` has nothing to free
+        response._content_consumed = True
+        response.raw = io.BytesIO(response._content)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=interaction["elapsed"])
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def install(session, adapter):
+    """
+    The function `install` makes a `requests.Session` send all its HTTP and HTTPS requests through
+    an adapter.
+    """
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter
+
+
+def install_from_environment(session):
+    """
+    The function `install_from_environment` installs the recording or the replay of the cassette
+    given by the environment variables in a session. In record mode, the cassette is saved at exit.
+
+    :return: The adapter installed, or None if `WEAPON_CASSETTE` is not set.
+    """
+    path = os.environ.get(CASSETTE_ENV)
+    if not path:
+        return None
+    mode = os.environ.get(MODE_ENV, "replay")
+    if mode == "record":
+        adapter = RecordingAdapter(path)
+        atexit.register(adapter.save)
+    elif mode == "replay":
+        adapter = ReplayAdapter(path, float(os.environ.get(LATENCY_SCALE_ENV, "1")))
+    else:
+        raise ValueError(f"{MODE_ENV} must be 'record' or 'replay', not {mode!r}")
+    return install(session, adapter)
@@ -0,0 +1,226 @@
+import os
+import threading
+from collections import Counter
+
+# Tokens of the message sent to ChatGPT per turn at most (context digest, summary, recent turns and
+# prompt), set with the environment variable WEAPON_CHAT_TOKEN_BUDGET. The server takes a single
+# message, so the whole conversation is sent again at every turn: the budget bounds its size.
+TOKEN_BUDGET = int(os.environ.get("WEAPON_CHAT_TOKEN_BUDGET", "3000"))
+# The tokens are estimated without the tokenizer of the model: about 4 characters per token in English.
+CHARS_PER_TOKEN = 4
+# Last turns always sent verbatim. The older ones are folded into the summary once the conversation
+# exceeds the budget.
+KEEP_TURNS = 2
+# Share of the budget for the summary of the older turns and for the inventory digest.
+SUMMARY_SHARE = 0.25
+DIGEST_SHARE = 0.2
+# Values listed per attribute in the inventory digest, the most frequent first.
+DIGEST_TOP_VALUES = 8
+
+MESSAGE_CONTEXT = "Context, the weapon inventory of the user:\n{0}\n\n".format
+MESSAGE_SUMMARY = "Summary of the earlier conversation:\n{0}\n\n".format
+MESSAGE_TURN = "User: {0}\nAssistant: {1}\n\n".format
+MESSAGE_PROMPT = "User: {0}".format
+SUMMARY_REQUEST = ("Summarize the following conversation in at most {0} words. Keep the names, numbers "
+                   "and conclusions needed to continue it.\n\n{1}").format
+
+
+def estimate_tokens(text):
+    """
+    The function `estimate_tokens` estimates the number of tokens of a text (`CHARS_PER_TOKEN`).
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text, tokens):
+    """
+    The function `truncate_tokens` cuts a text to about `tokens` tokens, at the last word boundary.
+    """
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "..."
+
+
+def _top_values(counter):
+    return ", ".join(f"{value} {count}" for value, count in counter.most_common(DIGEST_TOP_VALUES))
+
+
+def inventory_digest(weapons, max_tokens):
+    """
+    The function `inventory_digest` describes an inventory in a few lines: the number of weapons,
+    the most frequent types, manufacturers and calibers, and the range of the numeric attributes. It
+    gives ChatGPT the context of the inventory at a bounded size, whatever the number of weapons.
+
+    :param weapons: The `Weapon` objects of the inventory.
+    :param max_tokens: The size of the digest at most, in estimated tokens.
+    :return: The digest, empty for an empty inventory.
+    """
+    if not weapons:
+        return ""
+    lines = [f"{len(weapons)} weapons."]
+    for label, attribute in (("Types", "Type"), ("Manufacturers", "Manufacturer"), ("Calibers", "Caliber")):
+        counter = Counter(getattr(weapon, attribute) for weapon in weapons)
+        lines.append(f"{label} ({len(counter)}): {_top_values(counter)}.")
+    for label, attribute in (("Magazine capacity", "MagazineCapacity"), ("Fire rate", "FireRate"),
+                             ("Ammo count", "AmmoCount")):
+        values = [value for weapon in weapons if isinstance(value := getattr(weapon, attribute), (int, float))]
+        if values:
+            total = f", total {sum(values)}" if attribute == "AmmoCount" else ""
+            lines.append(f"{label}: {min(values)} to {max(values)}{total}.")
+    return truncate_tokens("\n".join(lines), max_tokens)
+
+
+# The class `ConversationSession` keeps a conversation with ChatGPT and builds the message of every
+# turn within a token budget: the inventory digest, the summary of the older turns, the last turns
+# verbatim and the new prompt. Once the turns exceed the budget, the oldest ones are folded into the
+# summary (`turns_to_summarize`, `fold`). The size and latency of every request are recorded.
+class ConversationSession:
+    def __init__(self, token_budget=TOKEN_BUDGET, keep_turns=KEEP_TURNS):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary = ""
+        self.turns = []  # (prompt, answer) of the turns not folded into the summary
+        self.summarized_turns = 0
+        self.metrics = []  # One dictionary per request, see `record`
+        self._lock = threading.Lock()
+
+    @property
+    def summary_tokens(self):
+        return int(self.token_budget * SUMMARY_SHARE)
+
+    @property
+    def digest_tokens(self):
+        return int(self.token_budget * DIGEST_SHARE)
+
+    def build_message(self, prompt, digest=""):
+        """
+        The function `build_message` builds the message of a turn. The most recent turns are kept
+        first: a turn which would exceed the budget is left out with the older ones, which is only
+        the case until they are folded into the summary.
+
+        :param prompt: The new prompt of the user, always sent whole.
+        :param digest: The inventory digest, sent as context.
+        :return: A tuple (message, number of previous turns included).
+        """
+        with self._lock:
+            turns, summary = list(self.turns), self.summary
+        head = (MESSAGE_CONTEXT(digest) if digest else "") + (MESSAGE_SUMMARY(summary) if summary else "")
+        tail = MESSAGE_PROMPT(prompt)
+        available = self.token_budget - estimate_tokens(head) - estimate_tokens(tail)
+        included = []
+        for turn in reversed(turns):
+            text = MESSAGE_TURN(*turn)
+            if (tokens := estimate_tokens(text)) > available:
+                break
+            available -= tokens
+            included.append(text)
+        return head + "".join(reversed(included)) + tail, len(included)
+
+    def add_turn(self, prompt, answer):
+        with self._lock:
+            self.turns.append((prompt, answer))
+
+    def turns_to_summarize(self):
+        """
+        The function `turns_to_summarize` returns the oldest turns to fold into the summary, all but
+        the last `keep_turns`, if the summary and the turns exceed the budget left by the digest and
+        the next prompt. Otherwise it returns an empty list.
+        """
+        with self._lock:
+            tokens = estimate_tokens(self.summary) + sum(estimate_tokens(MESSAGE_TURN(*turn)) for turn in self.turns)
+            if tokens <= self.token_budget - self.digest_tokens - self.summary_tokens:
+                return []
+            return self.turns[:max(0, len(self.turns) - self.keep_turns)]
+
+    def summary_request(self, turns):
+        """
+        The function `summary_request` returns the prompt asking ChatGPT to summarize the current
+        summary followed by `turns`.
+        """
+        with self._lock:
+            summary = self.summary
+        text = (MESSAGE_SUMMARY(summary) if summary else "") + "".join(MESSAGE_TURN(*turn) for turn in turns)
+        # The words of a summary are about 4/3 tokens each
+        return SUMMARY_REQUEST(self.summary_tokens * 3 // 4, text)
+
+    def local_summary(self, turns):
+        """
+        The function `local_summary` summarizes without the server, when the summary request fails:
+        the previous summary followed by the prompts of `turns`, the most recent kept if it is longer
+        than a summary.
+        """
+        with self._lock:
+            summary = self.summary
+        text = (summary + " " + " ".join(f"The user asked: {prompt}" for prompt, _ in turns)).strip()
+        limit = self.summary_tokens * CHARS_PER_TOKEN - 3
+        return text if len(text) <= limit else "..." + text[-limit:].split(" ", 1)[-1]
+
+    def fold(self, turns, summary):
+        """
+        The function `fold` replaces the summary, and removes `turns` (the oldest ones) from the turns
+        sent verbatim, unless the conversation was reset meanwhile.
+        """
+        with self._lock:
+            if self.turns[:len(turns)] != turns:
+                return
+            del self.turns[:len(turns)]
+            self.summary = truncate_tokens(summary.strip(), self.summary_tokens)
+            self.summarized_turns += len(turns)
+
+    def record(self, kind, request_bytes, response_bytes, seconds, queue_seconds=0.0, **details):
+        """
+        The function `record` records a request of the conversation.
+
+        :param kind: 'turn' for a prompt of the user, 'summary' for a summary request.
+        :param request_bytes: The size of the JSON body sent.
+        :param response_bytes: The size of the body received, 0 if the request failed.
+        :param seconds: The time from the sending of the request to its response.
+        :param queue_seconds: The time the request waited in the scheduler before its sending, for a
+        free slot of the endpoint and for its rate limit.
+        :return: The recorded dictionary.
+        """
+        entry = {"kind": kind, "request_bytes": request_bytes, "response_bytes": response_bytes,
+                 "latency_ms": seconds * 1000, "queue_ms": queue_seconds * 1000, **details}
+        with self._lock:
+            entry["turn"] = self.summarized_turns + len(self.turns) + (kind == "turn")
+            self.metrics.append(entry)
+        return entry
+
+    def report(self):
+        """
+        The function `report` returns the number of turns and of summary requests, and the size, the
+        latency and the wait in the scheduler of the turns: total, mean and largest.
+        """
+        with self._lock:
+            metrics = list(self.metrics)
+        turns = [entry for entry in metrics if entry["kind"] == "turn"]
+        request_bytes = [entry["request_bytes"] for entry in turns]
+        latencies = [entry["latency_ms"] for entry in turns]
+        queue_times = [entry["queue_ms"] for entry in turns]
+        return {
+            "turns": len(turns),
+            "summaries": len(metrics) - len(turns),
+            "summarized_turns": self.summarized_turns,
+            "request_bytes": sum(request_bytes),
+            "mean_request_bytes": sum(request_bytes) / len(turns) if turns else 0,
+            "max_request_bytes": max(request_bytes, default=0),
+            "mean_latency_ms": sum(latencies) / len(turns) if turns else 0,
+            "max_latency_ms": max(latencies, default=0),
+            "mean_queue_ms": sum(queue_times) / len(turns) if turns else 0,
+            "max_queue_ms": max(queue_times, default=0),
+        }
+
+    def transcript(self):
+        """
+        The function `transcript` returns the summary and the (prompt, answer) turns kept verbatim.
+        """
+        with self._lock:
+            return self.summary, list(self.turns)
+
+    def reset(self):
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+            self.summarized_turns = 0
+            self.metrics = []
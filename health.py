@@ -0,0 +1,130 @@
+import threading
+import time
+
+# States of a circuit breaker
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the circuit of its endpoint is open.
+    """
+
+
+# The class `CircuitBreaker` protects an endpoint of the server. After `failure_threshold` failures
+# in a row the circuit opens and the requests fail immediately. After `reset_timeout` seconds one
+# trial request is let through (half-open): its success closes the circuit, its failure opens it
+# again.
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, reset_timeout=10.0, on_state_change=None):
+        """
+        :param name: The name of the protected endpoint, used in the messages.
+        :param failure_threshold: The number of failures in a row opening the circuit.
+        :param reset_timeout: The number of seconds before a trial request when the circuit is open.
+        :param on_state_change: A function called with (name, new state) when the state changes.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        # Called with the lock held, the callback is called by the caller once the lock is released
+        changed = state != self.state
+        self.state = state
+        return changed
+
+    def _notify(self, changed):
+        if changed and self.on_state_change is not None:
+            self.on_state_change(self.name, self.state)
+
+    def before_request(self):
+        """
+        The function `before_request` must be called before each request. It raises
+        `CircuitOpenError` if the request must not be sent.
+        """
+        with self._lock:
+            changed = False
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"The server is unavailable ({self.name}), next try in {remaining:.0f} s")
+                changed = self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    raise CircuitOpenError(f"The server is unavailable ({self.name}), checking it again")
+                self._trial_running = True
+        self._notify(changed)
+
+    def release(self):
+        """
+        The function `release` must be called instead of `record_success` or `record_failure` when a
+        request allowed by `before_request` was finally not sent.
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        """
+        The function `record_success` records a request answered by the server and closes the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            changed = self._set_state(CLOSED)
+        self._notify(changed)
+
+    def record_failure(self):
+        """
+        The function `record_failure` records a request that failed (no connection, timeout or server
+        error) and opens the circuit after too many failures, or after a failed trial.
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            changed = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                changed = self._set_state(OPEN)
+        self._notify(changed)
+
+
+# The class `HealthMonitor` calls a probe function in a background thread every `interval` seconds,
+# and `on_result` with the result of the probe, or False if the probe raised an exception.
+class HealthMonitor:
+    def __init__(self, probe, on_result, interval=5.0):
+        self.probe = probe
+        self.on_result = on_result
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        The function `start` starts the background probe, if it is not running yet.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        The function `stop` stops the background probe.
+        """
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                result = self.probe()
+            except Exception:
+                result = False
+            self.on_result(result)
+            self._stopped.wait(self.interval)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import uuid
+import snapshot
+
+# Size of the pieces read from the image files and sent to the server: an image is never loaded
+# whole in memory, whatever its size.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Name of the multipart field of the image expected by the classification endpoint.
+IMAGE_FIELD = "image"
+# Images kept in the classification cache at most: the least recently used ones are dropped first.
+CACHE_MAX_ENTRIES = 5000
+
+
+def file_digest(path):
+    """
+    The function `file_digest` returns the SHA-256 digest of a file, read by chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as image_file:
+        while chunk := image_file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# The class `MultipartUpload` is the body of a multipart/form-data request with one image file, sent
+# by chunks as it is read from the disk (chunked transfer encoding). `on_progress` is called with
+# (bytes of the file sent, size of the file) after each chunk. `digest`, the SHA-256 digest of the
+# file if known (`file_digest`), identifies the body without reading it (see `cassette.request_key`).
+class MultipartUpload:
+    def __init__(self, path, on_progress=None, field=IMAGE_FIELD, digest=None):
+        self.path = path
+        self.on_progress = on_progress
+        self.digest = digest
+        self.size = os.path.getsize(path)
+        self.boundary = uuid.uuid4().hex
+        filename = os.path.basename(path).replace('"', "_")
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.preamble = (f"--{self.boundary}\r\n"
+                         f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                         f"Content-Type: {mime_type}\r\n\r\n").encode("utf-8")
+        self.epilogue = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __iter__(self):
+        yield self.preamble
+        sent = 0
+        with open(self.path, "rb") as image_file:
+            while chunk := image_file.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+                sent += len(chunk)
+                if self.on_progress is not None:
+                    self.on_progress(sent, self.size)
+        yield self.epilogue
+
+
+# The class `ClassificationCache` keeps the classification results of the images by SHA-256 digest
+# of their content, in a JSON file of the user cache directory, so the same image is never sent
+# twice, whatever its name or URL. The results are added in memory and the file is written once per
+# batch by `save`. Beyond `max_entries` images, the least recently used ones are dropped.
+class ClassificationCache:
+    def __init__(self, path, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._modified = False
+        try:
+            with open(path, encoding="utf-8") as cache_file:
+                self._results = json.load(cache_file)  # Digest -> results, the least recently used first
+        except (OSError, ValueError):
+            self._results = {}
+
+    def get(self, digest):
+        """
+        The function `get` returns the cached results of an image: a list of (score, fields), or None.
+        """
+        with self._lock:
+            if (results := self._results.pop(digest, None)) is not None:
+                self._results[digest] = results
+            return results
+
+    def put(self, digest, results):
+        """
+        The function `put` adds the results of an image, dropping the least recently used images
+        beyond `max_entries`. They are written to the file by `save`.
+        """
+        with self._lock:
+            self._results.pop(digest, None)
+            self._results[digest] = results
+            while len(self._results) > self.max_entries:
+                del self._results[next(iter(self._results))]
+            self._modified = True
+
+    def save(self):
+        """
+        The function `save` writes the cache to its file if it changed since the last save. The file
+        is written next to the old one and then renamed, so a crash never leaves a truncated cache.
+        """
+        with self._lock:
+            if not self._modified:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as cache_file:
+                json.dump(self._results, cache_file)
+            os.replace(temporary_path, self.path)
+            self._modified = False
+
+
+def cache_path():
+    """
+    The function `cache_path` returns the classification cache file, next to the inventory snapshots.
+    """
+    return os.path.join(snapshot.cache_dir(), "classifications.json")
@@ -0,0 +1,113 @@
+import gc
+import json
+import sys
+import tracemalloc
+import weakref
+from collections import Counter
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+try:
+    from PyQt5 import sip
+except ImportError:
+    import sip
+
+# Names of the pages of the stacked layout of `WeaponView`, by index.
+PAGE_NAMES = ("main", "add_weapon", "update_weapon", "all_weapons", "weapon_details", "search", "openai",
+              "classification")
+# Number of lines of code reported for the heap growth between two navigations.
+TOP_ALLOCATIONS = 5
+
+
+# The class `LifecycleTracker` is a debug instrumentation of `WeaponView`, enabled with the
+# environment variable WEAPON_DEBUG_LIFECYCLE=1. At every navigation and every refresh of a page, it
+# counts the live QObjects of each page and the live widgets of the application, and compares the
+# Python heap (tracemalloc) with the previous navigation. Objects removed from a page by a refresh
+# must be destroyed: the tracker reports those still alive, either as a Qt object detached from the
+# page but never deleted, or as a Python wrapper of a deleted Qt object still referenced somewhere.
+class LifecycleTracker:
+    def __init__(self, view):
+        self.view = view
+        self.records = []
+        self.survivors = Counter()  # (page, kind, class name) -> number of objects
+        self._page_objects = {}  # page name -> {id: weak reference} at its last checkpoint
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self._heap_snapshot = tracemalloc.take_snapshot()
+
+        view.stacked_layout.currentChanged.connect(self.on_navigation)
+        # The signals after which a page is rebuilt
+        view.weapon_updates.changes_ready.connect(lambda *_: self.schedule_checkpoint("all_weapons"))
+        view.presenter.search_started.connect(lambda *_: self.schedule_checkpoint("search"))
+        if (app := QCoreApplication.instance()) is not None:
+            app.aboutToQuit.connect(self.print_report)
+
+    def page_widget(self, page):
+        return self.view.stacked_layout.widget(PAGE_NAMES.index(page))
+
+    def on_navigation(self, index):
+        """
+        The function `on_navigation` checks the page left and the page displayed, and records the heap
+        growth since the previous navigation.
+        """
+        self.schedule_checkpoint(PAGE_NAMES[index], navigation=True)
+
+    def schedule_checkpoint(self, page, navigation=False):
+        """
+        The function `schedule_checkpoint` runs `checkpoint` once the event loop has processed the
+        pending deletions (`deleteLater`) of the current slot.
+        """
+        QTimer.singleShot(0, lambda: self.checkpoint(page, navigation))
+
+    def checkpoint(self, page, navigation=False):
+        """
+        The function `checkpoint` records the objects of a page, reports the objects of its previous
+        checkpoint that survived the refresh, and for a navigation records the heap growth.
+
+        :param page: The name of the page, see `PAGE_NAMES`.
+        :param navigation: Whether the checkpoint follows a navigation.
+        :return: The record of this checkpoint.
+        """
+        gc.collect()
+        objects = {id(obj): obj for obj in self.page_widget(page).findChildren(QObject)}
+        survivors = Counter()
+        for object_id, reference in self._page_objects.get(page, {}).items():
+            obj = reference()
+            if obj is None or object_id in objects:
+                continue
+            kind = "dangling wrapper" if sip.isdeleted(obj) else "detached object"
+            survivors[(page, kind, type(obj).__name__)] += 1
+        self.survivors.update(survivors)
+        self._page_objects[page] = {object_id: weakref.ref(obj) for object_id, obj in objects.items()}
+
+        record = {
+            "page": page,
+            "event": "navigation" if navigation else "refresh",
+            "page_objects": len(objects),
+            "live_widgets": len(QApplication.allWidgets()),
+            "survivors": {f"{kind} {class_name}": count for (_, kind, class_name), count in survivors.items()},
+        }
+        if navigation:
+            heap_snapshot = tracemalloc.take_snapshot()
+            differences = heap_snapshot.compare_to(self._heap_snapshot, "lineno")
+            self._heap_snapshot = heap_snapshot
+            record["heap_growth_bytes"] = sum(difference.size_diff for difference in differences)
+            record["top_allocations"] = [str(difference) for difference in differences[:TOP_ALLOCATIONS]]
+        self.records.append(record)
+        return record
+
+    def report(self):
+        """
+        The function `report` returns the checkpoints and the objects that survived a refresh, by page.
+        """
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        return {
+            "checkpoints": self.records,
+            "survivors": [{"page": page, "kind": kind, "class": class_name, "count": count}
+                          for (page, kind, class_name), count in self.survivors.most_common()],
+            "traced_memory_bytes": traced_current,
+            "traced_memory_peak_bytes": traced_peak,
+        }
+
+    def print_report(self):
+        json.dump(self.report(), sys.stderr, indent=2)
+        sys.stderr.write("\n")
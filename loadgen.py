@@ -0,0 +1,358 @@
+"""
+Load generator of the Weapon server, built on the request code of the presenter.
+
+Run it with `python loadgen.py --url http://localhost:5000 --users 20 --rate 5 --duration 60`, or against the
+local mock server with `python loadgen.py --mock`. Write the JSON report with `--report report.json`.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from health import CircuitBreaker
+from mock_server import MockWeaponServer
+from presenter import WeaponPresenter
+from scheduler import BULK, INTERACTIVE, RequestScheduler
+
+# Mixes of operations by name: operation -> weight. `--mix` gives a custom mix.
+SCENARIOS = {
+    "browse": {"get": 70, "list": 10, "search": 20},
+    "crud": {"get": 40, "list": 5, "add": 20, "update": 20, "delete": 15},
+    "mixed": {"get": 50, "list": 5, "add": 10, "update": 10, "delete": 5, "search": 20},
+}
+OPERATIONS = ("get", "list", "add", "update", "delete", "search")
+# Keywords of the search operation.
+SEARCH_KEYWORDS = ("rifle", "pistol", "colt", "9mm", "sniper", "glock")
+# Ramp-up profiles: all the users at once, one more user at regular intervals, or RAMP_STEPS groups.
+RAMP_PROFILES = ("none", "linear", "step")
+RAMP_STEPS = 4
+# Percentiles of the latencies in the report.
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# The class `LatencyHistogram` counts latencies in logarithmic buckets 1% wide, like HdrHistogram: its
+# size does not depend on the number of requests, and every percentile is exact within 1%.
+class LatencyHistogram:
+    BUCKET_RATIO = 1.01
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        microseconds = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log(microseconds) / math.log(self.BUCKET_RATIO))] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        The function `percentile` returns the latency in seconds below which `percent` % of the
+        recorded latencies are (the upper bound of their bucket).
+        """
+        rank, seen = math.ceil(self.count * percent / 100), 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.BUCKET_RATIO ** (index + 1) / 1e6, self.max)
+        return 0.0
+
+    def summary(self):
+        summary = {"count": self.count, "mean_ms": 1000 * self.total / max(1, self.count), "max_ms": 1000 * self.max}
+        for percent in PERCENTILES:
+            summary[f"p{percent:g}_ms"] = 1000 * self.percentile(percent)
+        return summary
+
+
+# The class `LoadPresenter` is the presenter used by the load generator: the same requests, but its
+# scheduler has one worker per virtual user and no endpoint limit, and its circuit breakers never
+# open, so that the whole load reaches the server whatever its errors.
+class LoadPresenter(WeaponPresenter):
+    def __init__(self, base_url, users):
+        super().__init__([base_url])
+        self.scheduler.shutdown()
+        self.scheduler = RequestScheduler(workers=users)
+
+    def _breaker(self, endpoint, base_url):
+        return self.breakers.setdefault((base_url, endpoint), CircuitBreaker(endpoint, failure_threshold=math.inf))
+
+
+# The class `LoadGenerator` runs virtual users sending a mix of operations to the server, each at a
+# constant rate. The latency of a request is measured from the time it should have been sent by this
+# schedule, not from the time it was sent: when the server stalls, the requests that a real user
+# would have sent meanwhile count with their waiting time (coordinated omission). The time from the
+# sending is reported as the service time.
+class LoadGenerator:
+    def __init__(self, base_url, mix, users=10, rate=5.0, duration=30.0, ramp_up=0.0, ramp="linear", seed=0):
+        """
+        :param base_url: The URL of the server.
+        :param mix: A dictionary operation -> weight, see `OPERATIONS`.
+        :param users: The number of virtual users.
+        :param rate: The number of requests per second of each user.
+        :param duration: The number of seconds of the test, ramp-up included.
+        :param ramp_up: The number of seconds until all the users are started.
+        :param ramp: The ramp-up profile, see `RAMP_PROFILES`.
+        :param seed: The seed of the random choices, for repeatable runs.
+        """
+        self.base_url = base_url
+        self.mix = mix
+        self.users = users
+        self.rate = rate
+        self.duration = duration
+        self.ramp_up = ramp_up if ramp != "none" else 0.0
+        self.ramp = ramp
+        self.seed = seed
+        self.presenter = LoadPresenter(base_url, users)
+
+        self.weapon_ids = []
+        self.created_ids = []  # Weapons added by the test, the only ones updated and deleted
+        self._lock = threading.Lock()
+        self.latencies = {operation: LatencyHistogram() for operation in OPERATIONS}
+        self.service_times = {operation: LatencyHistogram() for operation in OPERATIONS}
+        self.errors = {operation: Counter() for operation in OPERATIONS}
+        self.timeline = Counter()  # (second, 'requests' or 'errors') -> number
+
+    def start_time(self, user):
+        """
+        The function `start_time` returns the number of seconds after the beginning of the test when
+        a virtual user starts, according to the ramp-up profile.
+        """
+        if self.ramp == "step":
+            return self.ramp_up * (user * RAMP_STEPS // self.users) / RAMP_STEPS
+        return self.ramp_up * user / self.users
+
+    def run(self):
+        """
+        The function `run` runs the test and returns its report.
+        """
+        self.weapon_ids = [weapon.Id for weapon in self.presenter._fetch_all_weapons(BULK)] or list(range(1, 101))
+        started_at = time.time()
+        begin = time.monotonic() + 0.1
+        users = [threading.Thread(target=self._run_user, args=(user, begin), name=f"user-{user}", daemon=True)
+                 for user in range(self.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.monotonic() - begin
+        report = self.report(started_at, elapsed)
+        self._delete_created()
+        self.presenter.scheduler.shutdown()
+        return report
+
+    def _run_user(self, user, begin):
+        generator = random.Random(self.seed * 100003 + user)
+        operations, weights = zip(*self.mix.items())
+        interval = 1.0 / self.rate
+        end = begin + self.duration
+        # A random phase, so that the users do not send their requests at the same instants
+        intended = begin + self.start_time(user) + generator.random() * interval
+        while intended < end:
+            if (delay := intended - time.monotonic()) > 0:
+                time.sleep(delay)
+            operation = generator.choices(operations, weights)[0]
+            sent = time.monotonic()
+            operation, outcome = self._execute(operation, generator)
+            done = time.monotonic()
+            with self._lock:
+                self.latencies[operation].record(done - intended)
+                self.service_times[operation].record(done - sent)
+                second = int(done - begin)
+                self.timeline[(second, "requests")] += 1
+                if outcome != "ok":
+                    self.errors[operation][outcome] += 1
+                    self.timeline[(second, "errors")] += 1
+            intended += interval
+
+    def _execute(self, operation, generator):
+        """
+        The function `_execute` sends one operation with the request code of the presenter. Updates and
+        deletions only touch the weapons added by the test, an addition is sent instead while there
+        are none.
+
+        :return: A tuple (operation sent, 'ok' or the error).
+        """
+        presenter = self.presenter
+        if operation in ("update", "delete"):
+            with self._lock:
+                if not self.created_ids:
+                    operation = "add"
+                elif operation == "delete":
+                    weapon_id = self.created_ids.pop(generator.randrange(len(self.created_ids)))
+                else:
+                    weapon_id = generator.choice(self.created_ids)
+        try:
+            if operation == "get":
+                response = presenter._request("GET", f"/api/Weapon/{generator.choice(self.weapon_ids)}")
+                if response.status_code == 200:
+                    presenter.create_weapon_from_data(response.json())
+                return operation, _outcome(response, 200, 404)
+            if operation == "list":
+                presenter._fetch_all_weapons(INTERACTIVE)
+            elif operation == "add":
+                response = presenter._request("POST", "/api/Weapon", json=_weapon_data(generator))
+                if response.status_code == 201:
+                    with self._lock:
+                        self.created_ids.append(response.json()["id"])
+                return operation, _outcome(response, 201)
+            elif operation == "update":
+                response = presenter._request("PUT", f"/api/Weapon/{weapon_id}", json=_weapon_data(generator))
+                return operation, _outcome(response, 200, 204)
+            elif operation == "delete":
+                response = presenter._request("DELETE", f"/api/Weapon/{weapon_id}")
+                return operation, _outcome(response, 200)
+            elif operation == "search":
+                presenter._search_backend(generator.choice(SEARCH_KEYWORDS), self.base_url)
+            return operation, "ok"
+        except Exception as e:
+            return operation, f"{type(e).__name__}: {e}"[:200]
+
+    def _delete_created(self):
+        """
+        The function `_delete_created` deletes the weapons added by the test and not deleted by it,
+        so that the inventory of the server is left as it was.
+        """
+        for weapon_id in self.created_ids:
+            try:
+                self.presenter._request("DELETE", f"/api/Weapon/{weapon_id}")
+            except Exception as e:
+                print(f"An error occurred while deleting the test weapon {weapon_id}: {str(e)}", file=sys.stderr)
+        self.created_ids.clear()
+
+    def report(self, started_at, elapsed):
+        """
+        The function `report` returns the results of the test as a dictionary that can be saved as JSON:
+        the latencies and errors of every operation and of all of them, and the timeline by second.
+        """
+        latency, service_time = LatencyHistogram(), LatencyHistogram()
+        operations = {}
+        for operation in OPERATIONS:
+            if not self.latencies[operation].count:
+                continue
+            latency.merge(self.latencies[operation])
+            service_time.merge(self.service_times[operation])
+            operations[operation] = {
+                "requests": self.latencies[operation].count,
+                "errors": sum(self.errors[operation].values()),
+                "error_kinds": dict(self.errors[operation].most_common()),
+                "latency": self.latencies[operation].summary(),
+                "service_time": self.service_times[operation].summary(),
+            }
+        errors = sum(sum(counter.values()) for counter in self.errors.values())
+        seconds = max((second for second, _ in self.timeline), default=-1) + 1
+        return {
+            "config": {
+                "url": self.base_url, "mix": self.mix, "users": self.users, "rate_per_user": self.rate,
+                "duration_s": self.duration, "ramp_up_s": self.ramp_up, "ramp": self.ramp, "seed": self.seed,
+            },
+            "started_at": started_at,
+            "elapsed_s": elapsed,
+            "requests": latency.count,
+            "errors": errors,
+            "throughput_rps": latency.count / elapsed if elapsed else 0.0,
+            "latency": latency.summary(),
+            "service_time": service_time.summary(),
+            "operations": operations,
+            "timeline": [{
+                "second": second,
+                "active_users": sum(self.start_time(user) <= second for user in range(self.users)),
+                "requests": self.timeline[(second, "requests")],
+                "errors": self.timeline[(second, "errors")],
+            } for second in range(seconds)],
+            "scheduler": self.presenter.scheduler.metrics(),
+        }
+
+
+def _outcome(response, *expected):
+    return "ok" if response.status_code in expected else f"HTTP {response.status_code}"
+
+
+def _weapon_data(generator):
+    number = generator.randrange(1_000_000)
+    return {
+        "name": f"Load test {number}", "type": "Rifle", "manufacturer": "Load Test", "caliber": "5.56mm",
+        "magazineCapacity": 30, "fireRate": 700, "ammoCount": 120, "images": None,
+    }
+
+
+def parse_mix(text):
+    """
+    The function `parse_mix` parses a mix of operations written 'get=60,list=10,search=30'.
+    """
+    mix = {}
+    for item in text.split(","):
+        operation, _, weight = item.partition("=")
+        operation = operation.strip()
+        if operation not in OPERATIONS:
+            raise ValueError(f"unknown operation: {operation} (among {', '.join(OPERATIONS)})")
+        mix[operation] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("the weights of the mix are all zero")
+    return mix
+
+
+def print_summary(report):
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f} s, {report['throughput_rps']:.1f} requests/s, "
+          f"{report['errors']} errors")
+    print(f"  {'operation':<10} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9}"
+          f" {'service p99':>12}")
+    for name, result in [*report["operations"].items(), ("all", report)]:
+        latency = result["latency"]
+        print(f"  {name:<10} {result['requests']:>9} {result['errors']:>7} {latency['p50_ms']:>9.1f}"
+              f" {latency['p99_ms']:>9.1f} {latency['p99.9_ms']:>9.1f} {latency['max_ms']:>9.1f}"
+              f" {result['service_time']['p99_ms']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="URL of the server, e.g. http://localhost:5000")
+    parser.add_argument("--mock", action="store_true", help="start the local mock server and test it")
+    parser.add_argument("--mock-weapons", type=int, default=1000, help="weapons of the mock server (default: 1000)")
+    parser.add_argument("--mock-latency", type=float, default=0.002, help="seconds per mock response (default: 0.002)")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed", help="mix of operations (default: mixed)")
+    parser.add_argument("--mix", help="custom mix of operations, e.g. get=60,list=10,search=30")
+    parser.add_argument("-u", "--users", type=int, default=10, help="number of virtual users (default: 10)")
+    parser.add_argument("-r", "--rate", type=float, default=5.0, help="requests per second of each user (default: 5)")
+    parser.add_argument("-d", "--duration", type=float, default=30.0, help="seconds of the test (default: 30)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="seconds until all the users run (default: 0)")
+    parser.add_argument("--ramp", choices=RAMP_PROFILES, default="linear", help="ramp-up profile (default: linear)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random choices (default: 0)")
+    parser.add_argument("--report", help="path of the JSON report")
+    args = parser.parse_args()
+    if args.mock == bool(args.url):
+        parser.error("give either --url or --mock")
+    if args.users < 1 or args.rate <= 0 or args.duration <= 0 or args.ramp_up < 0:
+        parser.error("--users, --rate and --duration must be positive")
+    try:
+        mix = parse_mix(args.mix) if args.mix else SCENARIOS[args.scenario]
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = MockWeaponServer(weapons=args.mock_weapons, latency=args.mock_latency).start() if args.mock else None
+    try:
+        generator = LoadGenerator(server.url if server else args.url.rstrip("/"), mix, args.users, args.rate,
+                                  args.duration, args.ramp_up, args.ramp, args.seed)
+        report = generator.run()
+    finally:
+        if server is not None:
+            server.stop()
+    print_summary(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""
+Starts the weapon client: `python main.py`.
+
+The GUI is imported under the `__main__` guard only: the processes decoding the large inventories
+(`parallel_decode.py`) import the main module of the program first, and this one stays light for
+them, while `python view.py` would make each of them import PyQt.
+"""
+
+if __name__ == "__main__":
+    import view
+    view.main()
@@ -0,0 +1,211 @@
+"""
+Local mock of the C# Weapon server, for the load generator and for trying the client without the server.
+
+Run it with `python mock_server.py --port 5000`, then use http://localhost:5000 as the URL of the server.
+The inventory is kept in memory and starts with synthetic weapons.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from bench import make_weapons
+import wire_format
+
+# Paths of the weapon endpoints.
+WEAPON_PATH = re.compile(r"^/api/Weapon/?$")
+WEAPON_ID_PATH = re.compile(r"^/api/Weapon/(\d+)$")
+# Fields of a weapon by lowercase name: like ASP.NET, the server binds the keys of a body whatever
+# their case ("Name" or "name"). All of them but the id and the images are required to add a weapon.
+FIELD_NAMES = {field.lower(): field for field in wire_format.WEAPON_FIELDS}
+REQUIRED_FIELDS = tuple(field for field in wire_format.WEAPON_FIELDS if field not in ("id", "images"))
+# Tags returned by the mock of the Imagga classification, with a random confidence.
+IMAGGA_TAGS = ("rifle", "pistol", "shotgun", "weapon", "gun", "firearm", "military", "metal", "trigger", "barrel")
+
+
+# The class `MockWeaponServer` is a threaded HTTP server with the endpoints of the C# server used by
+# the presenter: the weapon CRUD, the Imagga classification of a keyword or of an uploaded image, and
+# ChatGPT. Every response waits `latency` seconds first, to simulate the work of the real server.
+class MockWeaponServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, weapons=1000, latency=0.0):
+        """
+        :param port: The port to listen on, a free port if 0 (see `url`).
+        :param weapons: The number of synthetic weapons of the initial inventory.
+        :param latency: The number of seconds every response waits before being sent.
+        """
+        super().__init__(("localhost", port), MockRequestHandler)
+        self.latency = latency
+        self.records = {record["id"]: record for record in wire_format.encode_records(make_weapons(weapons))}
+        self.next_id = weapons + 1
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://localhost:{self.server_address[1]}"
+
+    def start(self):
+        """
+        The function `start` serves the requests in a daemon thread and returns at once.
+        """
+        threading.Thread(target=self.serve_forever, name="mock-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# The class `MockRequestHandler` answers one connection of `MockWeaponServer`, with the JSON bodies of
+# the C# server (gzip compressed when large and accepted).
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like Kestrel
+    disable_nagle_algorithm = True  # The headers and the body are written separately
+
+    def log_message(self, format, *args):
+        pass  # One line per request would slow down the load tests
+
+    def _send(self, status, payload=None, content_type=wire_format.JSON_TYPE):
+        body = b"" if payload is None else payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        encoding = "identity"
+        if len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            encoding = "gzip"
+            body = wire_format.compress(body, encoding)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        chunks = []
+        while size := int(self.rfile.readline().split(b";")[0], 16):
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        self.rfile.readline()  # Blank line after the last chunk
+        return b"".join(chunks)
+
+    def _read_json(self):
+        return json.loads(self._read_body() or b"{}")
+
+    def _handle(self, method):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        try:
+            if WEAPON_PATH.match(url.path):
+                self._weapons(method)
+            elif match := WEAPON_ID_PATH.match(url.path):
+                self._weapon(method, int(match.group(1)))
+            elif url.path == "/api/Imagga/classify" and method == "GET":
+                self._classify(parse_qs(url.query).get("keyword", [""])[0])
+            elif url.path == "/api/Imagga/classify" and method == "POST":
+                # Image upload: the tags depend on the content of the body
+                self._classify(hashlib.sha1(self._read_body()).hexdigest())
+            elif url.path == "/api/ChatGPT" and method == "POST":
+                # The message of a conversation ends with the new prompt, after the context and history
+                message = str(self._read_json().get("Message", ""))
+                if message.startswith("Summarize"):
+                    self._send(200, {"response": f"Mock summary of {message.count('User: ')} turns."})
+                else:
+                    self._send(200, {"response": f"Mock answer to: {message.rsplit('User: ', 1)[-1][:200]}"})
+            else:
+                self._send(404)
+        except (ValueError, KeyError) as e:
+            self._send(400, {"error": str(e)})
+
+    def _read_weapon(self):
+        """
+        The function `_read_weapon` reads the weapon of a JSON body, with the keys of `WEAPON_FIELDS`
+        whatever their case in the body. The other keys are ignored.
+        """
+        return {FIELD_NAMES[key.lower()]: value for key, value in self._read_json().items()
+                if key.lower() in FIELD_NAMES}
+
+    def _weapons(self, method):
+        server = self.server
+        if method == "GET":
+            with server.lock:
+                records = list(server.records.values())
+            # Column-oriented JSON when the client accepts it, like the server with the compact format
+            if wire_format.COLUMNS_TYPE in self.headers.get("Accept", ""):
+                columns = {field: [record.get(field) for record in records] for field in wire_format.WEAPON_FIELDS}
+                self._send(200, columns, wire_format.COLUMNS_TYPE)
+            else:
+                self._send(200, records)
+        elif method == "POST":
+            record = self._read_weapon()
+            if missing := [field for field in REQUIRED_FIELDS if field not in record]:
+                raise ValueError(f"Missing fields: {', '.join(missing)}")
+            with server.lock:
+                record["id"] = server.next_id
+                server.next_id += 1
+                server.records[record["id"]] = record
+            self._send(201, record)
+        else:
+            self._send(405)
+
+    def _weapon(self, method, weapon_id):
+        server = self.server
+        # Read the body first to keep the connection usable whatever the answer
+        updates = self._read_weapon() if method == "PUT" else None
+        with server.lock:
+            record = server.records.get(weapon_id)
+            if record is None:
+                status, payload = 404, None
+            elif method == "GET":
+                status, payload = 200, dict(record)
+            elif method == "PUT":
+                record.update(updates, id=weapon_id)
+                status, payload = 204, None
+            elif method == "DELETE":
+                del server.records[weapon_id]
+                status, payload = 200, None
+            else:
+                status, payload = 405, None
+        self._send(status, payload)
+
+    def _classify(self, keyword):
+        generator = random.Random(keyword)
+        tags = [{"confidence": round(generator.uniform(5, 100), 2), "tag": {"en": tag}}
+                for tag in generator.sample(IMAGGA_TAGS, k=6)]
+        self._send(200, {"result": {"tags": tags}, "status": {"type": "success"}})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=5000, help="port to listen on (default: 5000)")
+    parser.add_argument("--weapons", type=int, default=1000, help="number of weapons of the inventory (default: 1000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds waited before every response (default: 0)")
+    args = parser.parse_args()
+    server = MockWeaponServer(args.port, args.weapons, args.latency)
+    print(f"Mock Weapon server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import json
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from model import Weapon
+import snapshot
+import wire_format
+
+# A JSON array smaller than PARALLEL_MIN_BYTES is decoded in the calling thread: sending it to the
+# process pool would cost more than it saves. Larger ones are split in ranges of about CHUNK_BYTES,
+# at least one per worker.
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+CHUNK_BYTES = 4 * 1024 * 1024
+# Number of decoding processes, one per core by default.
+WORKERS = os.cpu_count() or 1
+
+# The separator between two records of the array: the first record of a range starts at its '{'. The
+# same characters may appear in a string value: a separator is only used if an even number of quotes
+# (not counting the escaped ones) precedes it since the start of the previous record.
+RECORD_SEPARATOR = re.compile(rb"}\s*,\s*{")
+# A run of backslashes before a quote, which escape the quote if they are an odd number.
+BACKSLASHES_QUOTE = re.compile(rb'\\\\*"')
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """
+    The function `_get_pool` returns the process pool, started on first use. The processes are not
+    forked from the GUI process, whose threads could hold locks at the time of the fork: they are
+    forked from a fork server which only imports this module.
+
+    Like every process started by `multiprocessing` without fork, each process imports the main
+    module of the program first, so the program must start the decoding under
+    `if __name__ == "__main__":`, and should start from a light main module (`main.py` for the
+    client) rather than one importing the GUI. A decoding started while a process of the pool imports
+    the main module raises RuntimeError, instead of starting processes recursively.
+    """
+    global _pool, _pool_workers
+    if getattr(multiprocessing.current_process(), "_inheriting", False):
+        raise RuntimeError("The decoding was started while a decoding process imported the main module: "
+                           "start it under 'if __name__ == \"__main__\":'")
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    """
+    The function `_discard_pool` drops a pool whose worker died (`BrokenProcessPool`), so the next
+    decoding starts a new one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _in_string(content, start, end):
+    """
+    The function `_in_string` tells whether the position `end` is inside a string value, `start` being
+    outside any string.
+    """
+    quotes = content.count(b'"', start, end)
+    if content.find(b"\\", start, end) != -1:  # Most inventories have no escaped character at all
+        quotes -= sum(len(match) % 2 == 0 for match in BACKSLASHES_QUOTE.findall(content, start, end))
+    return quotes % 2 == 1
+
+
+def split_records(content, chunks):
+    """
+    The function `split_records` splits a JSON array of records in about `chunks` byte ranges, each
+    starting at the beginning of a record.
+
+    :param content: The JSON array.
+    :param chunks: The number of ranges wanted.
+    :return: The list of (start, end) ranges, covering all the records, or None if `content` is not
+    a non-empty JSON array.
+    """
+    start = len(content) - len(content.lstrip())
+    end = len(content.rstrip())
+    if content[start:start + 1] != b"[" or content[end - 1:end] != b"]":
+        return None
+    boundaries = [start + 1]
+    step = max(1, (end - start) // chunks)
+    position = boundaries[-1] + step
+    while (match := RECORD_SEPARATOR.search(content, position, end)) is not None:
+        if _in_string(content, boundaries[-1], match.start()):
+            position = match.start() + 1  # In a string value, try the next separator
+            continue
+        boundaries.append(match.end() - 1)
+        position = boundaries[-1] + step
+    boundaries.append(end - 1)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _decode_range(name, start, end):
+    """
+    The function `_decode_range` runs in a worker process. It decodes the records of a range of the
+    JSON array stored in the shared memory block `name`, and writes their columns in a new shared
+    memory block in the layout of the snapshot (`snapshot.encode_columns`).
+
+    :return: A tuple (name of the new block, number of weapons).
+    """
+    body = shared_memory.SharedMemory(name)
+    try:
+        records = json.loads(b"[" + bytes(body.buf[start:end]).rstrip(b", \t\r\n") + b"]")
+    finally:
+        body.close()
+    columns = [[record.get(field) for record in records] if field == "images"
+               else [record[field] for record in records] for field in wire_format.WEAPON_FIELDS]
+    blocks = snapshot.encode_columns(columns)
+    result = shared_memory.SharedMemory(create=True, size=max(1, sum(map(len, blocks))))
+    offset = 0
+    for block in blocks:
+        result.buf[offset:offset + len(block)] = block
+        offset += len(block)
+    result.close()
+    return result.name, len(records)
+
+
+def _read_result(name, count):
+    """
+    The function `_read_result` builds the weapons of a block written by `_decode_range`, and frees
+    the block.
+    """
+    block = shared_memory.SharedMemory(name)
+    try:
+        columns, _ = snapshot.decode_columns(block.buf, 0, count)
+    finally:
+        block.close()
+        block.unlink()
+    return map(Weapon, *columns)
+
+
+def decode_weapons_parallel(content, workers=None):
+    """
+    The function `decode_weapons_parallel` decodes a JSON array of weapons in the process pool. The
+    body is copied once into shared memory, each worker decodes a range of records, and the columns
+    come back in shared memory in the compact layout of the snapshot. The calling thread only builds
+    the `Weapon` objects, and waits without holding the GIL meanwhile.
+
+    :param content: The JSON array of weapons.
+    :param workers: The number of processes, `WORKERS` by default.
+    :return: The list of `Weapon` objects in the order of the array. `ValueError` is raised if the
+    body is not a JSON array of weapons.
+    """
+    workers = workers or WORKERS
+    ranges = split_records(content, max(workers, len(content) // CHUNK_BYTES))
+    if ranges is None:
+        raise ValueError("The body is not a JSON array")
+    body = shared_memory.SharedMemory(create=True, size=max(1, len(content)))
+    pending = []
+    pool = None
+    try:
+        body.buf[:len(content)] = content
+        pool = _get_pool(workers)
+        pending = [pool.submit(_decode_range, body.name, start, end) for start, end in ranges]
+        weapons = []
+        while pending:
+            weapons.extend(_read_result(*pending[0].result()))
+            del pending[0]
+        return weapons
+    except KeyError as e:
+        raise ValueError(f"Missing weapon field: {e}") from e
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        # After an error, free the blocks of the ranges decoded but not read
+        for future in pending:
+            if not future.cancel() and future.exception() is None:
+                _read_result(*future.result())
+        body.close()
+        body.unlink()
+
+
+def decode_weapons(content, content_type, workers=None):
+    """
+    The function `decode_weapons` decodes a weapon collection like `wire_format.decode_weapons`, in
+    the process pool for a large JSON array (`decode_weapons_parallel`), in the calling thread
+    otherwise, or if the parallel decoding fails.
+
+    :param content: The raw (already decompressed) body of the response.
+    :param content_type: The `Content-Type` header of the response.
+    :param workers: The number of processes, `WORKERS` by default.
+    :return: The list of `Weapon` objects contained in the body.
+    """
+    workers = workers or WORKERS
+    media_type = (content_type or wire_format.JSON_TYPE).split(";")[0].strip().lower()
+    if workers > 1 and len(content) >= PARALLEL_MIN_BYTES and media_type == wire_format.JSON_TYPE:
+        try:
+            return decode_weapons_parallel(content, workers)
+        except Exception as e:
+            print(f"Parallel decoding failed, decoding in one thread: {str(e)}")
+    return wire_format.decode_weapons(content, content_type)
@@ -0,0 +1,67 @@
+from PyQt5.QtCore import QObject, QRect, QTimer
+
+# Number of milliseconds without a change of the weapon id input or of the scroll position before
+# prefetching, so typing or scrolling does not send a request per key or per pixel.
+PREFETCH_DEBOUNCE_MS = 250
+# Ids around the displayed weapon prefetched for the next 'Get by ID', the closest first.
+NEIGHBOR_OFFSETS = (1, -1, 2, -2)
+# Height in pixels above and below the viewport of the 'All Weapons' page whose rows are prefetched.
+VIEWPORT_MARGIN = 400
+
+
+# The class `Prefetcher` guesses from the actions of the user which weapons will be opened next, and
+# asks the presenter to prefetch them with idle priority requests: the id being typed in the main page,
+# the neighbors of the weapon displayed, and the rows around the viewport of the 'All Weapons' page.
+class Prefetcher(QObject):
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.presenter = view.presenter
+
+        self._id_timer = self._debounce_timer(self.prefetch_typed_id)
+        self._scroll_timer = self._debounce_timer(self.prefetch_viewport)
+
+        # The arguments of the signals are dropped: `QTimer.start(int)` would take them as its interval
+        view.weapon_id_input.textChanged.connect(lambda _: self._id_timer.start())
+        view.scroll_area.verticalScrollBar().valueChanged.connect(lambda _: self._scroll_timer.start())
+        self.presenter.weapon_loaded.connect(self.prefetch_neighbors)
+        self.presenter.all_weapons_loaded.connect(lambda _: self._scroll_timer.start())
+
+    def _debounce_timer(self, slot):
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.setInterval(PREFETCH_DEBOUNCE_MS)
+        timer.timeout.connect(slot)
+        return timer
+
+    def prefetch_typed_id(self):
+        """
+        The function `prefetch_typed_id` prefetches the weapon whose id is in the input of the main
+        page, once the user stopped typing.
+        """
+        weapon_id = self.view.weapon_id_input.text().strip()
+        if weapon_id.isdigit():
+            self.presenter.prefetch_weapon(int(weapon_id))
+
+    def prefetch_neighbors(self, weapon):
+        """
+        The function `prefetch_neighbors` prefetches the weapons whose ids are close to the id of the
+        weapon just displayed.
+        """
+        for offset in NEIGHBOR_OFFSETS:
+            if weapon.Id + offset >= 0:
+                self.presenter.prefetch_weapon(weapon.Id + offset)
+
+    def prefetch_viewport(self):
+        """
+        The function `prefetch_viewport` prefetches the weapons of the 'All Weapons' page displayed in
+        its viewport or within `VIEWPORT_MARGIN` pixels of it.
+        """
+        scroll_area = self.view.scroll_area
+        if not scroll_area.isVisible():
+            return
+        top = scroll_area.verticalScrollBar().value() - VIEWPORT_MARGIN
+        visible = QRect(0, top, scroll_area.widget().width(), scroll_area.viewport().height() + 2 * VIEWPORT_MARGIN)
+        for weapon_id, weapon_label in self.view.weapon_labels.items():
+            if weapon_label.geometry().intersects(visible):
+                self.presenter.prefetch_weapon(weapon_id)
@@ -1,6 +1,63 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 import requests
 from PyQt5.QtCore import QObject, pyqtSignal
 from model import Weapon
+import cassette
+import conversation
+import image_classification
+from health import CLOSED, CircuitBreaker, CircuitOpenError, HealthMonitor
+from scheduler import BACKGROUND, BULK, IDLE, INTERACTIVE, RequestScheduler, endpoint_of
+from search_results import SearchHit, parse_search_results
+import parallel_decode
+import snapshot
+import wire_format
+
+# Number of search hits sent to the view per signal, the best ones first.
+SEARCH_CHUNK_SIZE = 50
+
+# The summaries of the conversation are sent to the ChatGPT endpoint with limits of their own, so a
+# summary never takes the place of a prompt of the user in the rate limit of the endpoint.
+CHATGPT_SUMMARY_LIMITS = "/api/ChatGPT summaries"
+
+# Limits of the request scheduler per endpoint: requests running at the same time, rate of the
+# external APIs (requests per second, burst) and requests allowed to wait, to protect the quotas
+# of Imagga and OpenAI against repeated clicks.
+ENDPOINT_CONCURRENCY = {"/api/Weapon": 4, "/api/Imagga": 2, "/api/ChatGPT": 1, CHATGPT_SUMMARY_LIMITS: 1}
+ENDPOINT_RATE_LIMITS = {"/api/Imagga": (1.0, 3), "/api/ChatGPT": (0.5, 2), CHATGPT_SUMMARY_LIMITS: (0.1, 1)}
+ENDPOINT_MAX_QUEUED = {"/api/Imagga": 5, "/api/ChatGPT": 3, CHATGPT_SUMMARY_LIMITS: 1}
+
+# Timeouts of the requests in seconds (connection, response), so that a stopped server cannot hang
+# a click, and the health probe of the server, a light request answered even without weapons.
+REQUEST_TIMEOUT = (3.05, 60)
+HEALTH_PROBE_PATH = "/api/Weapon/0"
+HEALTH_PROBE_INTERVAL = 5.0
+
+# A weapon fetched less than PREFETCH_MAX_AGE seconds ago is served from the cache without a
+# request. At most PREFETCH_MAX_PENDING prefetches wait at the same time, the others are dropped.
+PREFETCH_MAX_AGE = 30.0
+PREFETCH_MAX_PENDING = 16
+
+# Batch image classification: the endpoint receiving the images (multipart upload), and the number of
+# images uploaded at the same time (the scheduler limits the Imagga endpoint as well).
+CLASSIFY_PATH = "/api/Imagga/classify"
+CLASSIFY_CONCURRENCY = 2
+
+# ChatGPT conversation: the endpoint, which receives one message per turn, and the age in seconds
+# after which the inventory digest sent as context is built again even if the inventory looks the same.
+CHATGPT_PATH = "/api/ChatGPT"
+DIGEST_MAX_AGE = 60.0
+
+# Base URL of the C# server. Replace {port_number} by the port number of your server (see README).
+BASE_URL = "http://localhost:{port_number}"
+# Servers whose inventories are federated, one per site. The first one is the primary server: new
+# weapons, the Imagga/OpenAI requests and the weapons of unknown origin go to it.
+BACKENDS = [BASE_URL]
 
 # The `WeaponPresenter` class in Python defines methods to interact with a REST API for loading,
 # adding, updating, and deleting weapon data, as well as searching for keywords and using an OpenAI
@@ -10,16 +67,219 @@ class WeaponPresenter(QObject):
     # corresponds to a specific event that can occur in the application. 
     weapon_loaded = pyqtSignal(Weapon)
     all_weapons_loaded = pyqtSignal(list)
+    # Weapons of a full load streamed as each server answers: (origin server, weapons not already
+    # received from another server). `all_weapons_loaded` follows with the merged inventory.
+    weapons_batch_loaded = pyqtSignal(str, list)
+    # After `all_weapons_loaded`: (servers which did not answer, ids of the weapons kept from their
+    # previous load, which may be out of date), both empty if every server answered
+    stale_weapons = pyqtSignal(list, list)
     error_occurred = pyqtSignal(str)
     weapon_added = pyqtSignal(int)  
     weapon_deleted = pyqtSignal(int)  
     weapon_updated = pyqtSignal(int) 
-    keyword_founded = pyqtSignal(str)
+    # Keyword search: (search number, keyword), then chunks of ranked `SearchHit` of this search, then
+    # (search number, number of hits). Hits of a previous search can be recognized by their number.
+    search_started = pyqtSignal(int, str)
+    search_hits_found = pyqtSignal(int, list)
+    search_finished = pyqtSignal(int, int)
     openai_founded = pyqtSignal(str)
+    # Size and latency of a ChatGPT turn, after its answer (see `ConversationSession.record`)
+    openai_turn_finished = pyqtSignal(dict)
+    # Warm start: the saved inventory (weapons, save time), then the differences found by the
+    # background revalidation (added or modified weapons, ids of the removed weapons)
+    snapshot_loaded = pyqtSignal(list, float)
+    weapons_changed = pyqtSignal(list, list)
+    snapshot_revalidated = pyqtSignal()
+    # Health: state of the circuit breaker of an endpoint ('closed', 'open' or 'half-open'), and
+    # whether the background probe reaches the server
+    circuit_state_changed = pyqtSignal(str, str)
+    server_reachable = pyqtSignal(bool)
+    # Image classification: (batch number, images), then for each image its upload progress (batch
+    # number, image, percent) and either (batch number, image, ranked `SearchHit` tags, whether they
+    # come from the cache) or (batch number, image, error), then (batch number, classified, failed).
+    classification_started = pyqtSignal(int, list)
+    image_progress = pyqtSignal(int, str, int)
+    image_classified = pyqtSignal(int, str, list, bool)
+    image_failed = pyqtSignal(int, str, str)
+    classification_finished = pyqtSignal(int, int, int)
 
-    def __init__(self):
+    def __init__(self, backends=None):
         super().__init__()
-        
+        self.backends = list(backends or BACKENDS)
+        self.base_url = self.backends[0]
+        self.snapshot_path = snapshot.snapshot_path(" ".join(self.backends))
+        # Server owning each weapon id, learned from the loads
+        self.weapon_origins = {}
+
+        # Last known state of every weapon by id, filled by the loads and the snapshot, and the time
+        # of the last full load. While the server is unavailable, the loads are answered from it.
+        self.weapon_cache = {}
+        self.cache_time = 0.0
+        # Time (time.monotonic) when each cached weapon was received from its server, and when ids
+        # were found not to exist. Only these fresh entries answer the requests of the user.
+        self.cache_stamps = {}
+        self.absent_stamps = {}
+
+        # Prefetching of the weapons the user is about to open, with idle priority requests
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+        self._prefetching = set()
+        self._prefetched_ids = set()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.prefetch_count = 0
+        self.prefetch_hits = 0
+
+        # One circuit breaker per endpoint, and the background probe of the server started by
+        # `start_health_monitor`
+        self.breakers = {}
+        self.health_monitor = HealthMonitor(self._probe_server, self._on_probe_result, HEALTH_PROBE_INTERVAL)
+        self._server_reachable = None
+
+        self._search_number = 0
+
+        # Conversation with ChatGPT, one turn at a time since each one includes the previous answers,
+        # and the inventory digest sent as its context: (key of the inventory, build time, digest)
+        self.conversation = conversation.ConversationSession()
+        self._conversation_lock = threading.Lock()
+        self._summary_lock = threading.Lock()
+        self._digest = None
+
+        # Tags of the images already classified, by content digest, and the uploads running
+        self.classification_cache = image_classification.ClassificationCache(image_classification.cache_path())
+        self._classification_number = 0
+        self._classifying = {}  # Content digest -> `Future` of the tags of the image being uploaded
+        self._classifying_lock = threading.Lock()
+
+        # Every request goes through the scheduler: an interactive request is never queued behind
+        # background or bulk ones, and the external APIs are rate limited
+        self.scheduler = RequestScheduler(concurrency_limits=ENDPOINT_CONCURRENCY,
+                                          rate_limits=ENDPOINT_RATE_LIMITS,
+                                          max_queued=ENDPOINT_MAX_QUEUED)
+
+        # One session for every request: connections are kept alive and the server is told
+        # which compressions (gzip, and brotli when installed) the client can decode.
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept": wire_format.JSON_TYPE,
+            "Accept-Encoding": wire_format.accept_encoding(),
+        })
+        # Recording or offline replay of the traffic when WEAPON_CASSETTE is set, see cassette.py
+        self.cassette = cassette.install_from_environment(self.session)
+
+    def _request(self, method, path, priority=INTERACTIVE, base_url=None, limits=None, timing=None, **kwargs):
+        """
+        The function `_request` sends an HTTP request to the C# server through the scheduler and the
+        shared session, and waits for the response.
+
+        :param method: The HTTP method ('GET', 'POST', 'PUT' or 'DELETE').
+        :param path: The path of the endpoint, starting with '/api/'.
+        :param priority: The priority class of the request: `INTERACTIVE` (default), `BACKGROUND`,
+        `BULK` or `IDLE`. An idle request is speculative (prefetch): it is only sent while the circuit
+        of the endpoint is closed and its outcome is not recorded by the circuit breaker, so it never
+        opens the circuit nor takes the trial request meant for the user.
+        :param base_url: The server to send the request to, the primary server by default.
+        :param limits: The limits of the scheduler applied to the request, those of the endpoint by default.
+        :param timing: A dictionary which receives the `time.perf_counter()` at which the scheduler
+        started the request ('sent_at'), after its wait in the queue and for the rate limit.
+        :return: The `requests.Response` of the server. `health.CircuitOpenError` is raised at once
+        if the circuit of the endpoint is open, and `scheduler.QueueFullError` if too many requests
+        are already waiting for the endpoint.
+        """
+        base_url = base_url or self.base_url
+        endpoint = endpoint_of(path)
+        breaker = self._breaker(endpoint, base_url)
+        if priority != IDLE:
+            breaker.before_request()
+        elif breaker.state != CLOSED:
+            raise CircuitOpenError(f"The server is unavailable ({breaker.name}), not prefetching")
+        else:
+            breaker = None
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+
+        def send(*args, **kwargs):
+            if timing is not None:
+                timing["sent_at"] = time.perf_counter()
+            return self.session.request(*args, **kwargs)
+
+        try:
+            future = self.scheduler.submit(priority, limits or endpoint, send,
+                                           method, base_url + path, **kwargs)
+            response = future.result()
+        except requests.RequestException:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+
+    def _breaker(self, endpoint, base_url):
+        """
+        The function `_breaker` returns the circuit breaker of an endpoint of a server, created on
+        first use. With several servers, the name of the breaker includes the server.
+        """
+        if (breaker := self.breakers.get((base_url, endpoint))) is None:
+            name = endpoint if len(self.backends) == 1 else base_url + endpoint
+            breaker = self.breakers.setdefault((base_url, endpoint),
+                                               CircuitBreaker(name, on_state_change=self.circuit_state_changed.emit))
+        return breaker
+
+    def start_health_monitor(self):
+        """
+        The function `start_health_monitor` starts probing the server in the background every
+        `HEALTH_PROBE_INTERVAL` seconds.
+        """
+        self.health_monitor.start()
+
+    def _probe_server(self):
+        """
+        The function `_probe_server` sends the light health request to every server directly, without
+        the scheduler and the circuit breakers.
+
+        :return: A dictionary server -> whether it answered.
+        """
+        results = {}
+        for base_url in self.backends:
+            try:
+                results[base_url] = self.session.get(base_url + HEALTH_PROBE_PATH, timeout=1.0).status_code < 500
+            except requests.RequestException:
+                results[base_url] = False
+        return results
+
+    def _on_probe_result(self, results):
+        """
+        The function `_on_probe_result` feeds the result of the probe to the circuit breaker of the
+        weapons endpoint of each server, so that it opens before the user clicks when the server stops,
+        and closes as soon as the server is back.
+
+        :param results: A dictionary server -> whether it answered, or False if the probe failed.
+        """
+        results = results or dict.fromkeys(self.backends, False)
+        for base_url, answered in results.items():
+            breaker = self._breaker("/api/Weapon", base_url)
+            if not answered:
+                breaker.record_failure()
+            elif breaker.state != CLOSED:
+                breaker.record_success()
+        # The inventory is available as long as one server answers
+        reachable = any(results.values())
+        if reachable != self._server_reachable:
+            self._server_reachable = reachable
+            self.server_reachable.emit(reachable)
+
+    def _in_background(self, function, *args):
+        """
+        The function `_in_background` runs a slow operation in a daemon thread so that the GUI is not
+        frozen. Its signals are delivered to the view in the GUI thread.
+        """
+        threading.Thread(target=function, args=args, daemon=True).start()
 
     def create_weapon_from_data(self, weapon_data):
         """
@@ -39,6 +299,113 @@ class WeaponPresenter(QObject):
                     weapon_data['magazineCapacity'], weapon_data['fireRate'],
                     weapon_data['ammoCount'], weapon_data.get('images')) 
 
+    def _owner(self, weapon_id):
+        """
+        The function `_owner` returns the server owning a weapon, the primary server if unknown.
+        """
+        return self.weapon_origins.get(weapon_id, self.base_url)
+
+    def _get_weapon_response(self, weapon_id, priority=INTERACTIVE):
+        """
+        The function `_get_weapon_response` sends the GET request of a weapon to the server owning it.
+        If the owner is unknown, the servers are asked in order until one has the weapon. A server
+        down or unreachable is skipped.
+
+        :return: The `requests.Response` of the owner, or the last one if no server has the weapon.
+        The error of the last server is raised if none of them answered.
+        """
+        if weapon_id in self.weapon_origins:
+            return self._request("GET", f"/api/Weapon/{weapon_id}", priority, self.weapon_origins[weapon_id])
+        response, error = None, None
+        for base_url in self.backends:
+            try:
+                response = self._request("GET", f"/api/Weapon/{weapon_id}", priority, base_url)
+            except (CircuitOpenError, requests.RequestException) as e:
+                error = e  # Ask the other servers
+                continue
+            if response.status_code == 200:
+                self.weapon_origins[weapon_id] = base_url
+                break
+        if response is None:
+            raise error
+        return response
+
+    def _store_weapon(self, weapon):
+        """
+        The function `_store_weapon` caches a weapon just received from its server.
+        """
+        self.weapon_cache[weapon.Id] = weapon
+        self.cache_stamps[weapon.Id] = time.monotonic()
+        self.absent_stamps.pop(weapon.Id, None)
+
+    def _fresh_entry(self, weapon_id, count=True):
+        """
+        The function `_fresh_entry` looks for a weapon received less than `PREFETCH_MAX_AGE` seconds
+        ago, and counts the hit or the miss unless `count` is False.
+
+        :return: The `Weapon`, False if the weapon was found not to exist, or None if the server must be
+        asked.
+        """
+        now = time.monotonic()
+        if now - self.cache_stamps.get(weapon_id, -PREFETCH_MAX_AGE) < PREFETCH_MAX_AGE and weapon_id in self.weapon_cache:
+            entry = self.weapon_cache[weapon_id]
+        elif now - self.absent_stamps.get(weapon_id, -PREFETCH_MAX_AGE) < PREFETCH_MAX_AGE:
+            entry = False
+        else:
+            entry = None
+        if count:
+            if entry is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+                if weapon_id in self._prefetched_ids:
+                    self._prefetched_ids.discard(weapon_id)
+                    self.prefetch_hits += 1
+        return entry
+
+    def prefetch_weapon(self, weapon_id):
+        """
+        The function `prefetch_weapon` warms the cache with a weapon the user is likely to open, with an
+        idle priority request that never delays the other requests. It returns at once, and does
+        nothing if the weapon is fresh in the cache or already being prefetched.
+
+        :param weapon_id: The id of the weapon.
+        """
+        if (weapon_id in self._prefetching or len(self._prefetching) >= PREFETCH_MAX_PENDING
+                or self._fresh_entry(weapon_id, count=False) is not None):
+            return
+        self._prefetching.add(weapon_id)
+        self._prefetch_pool.submit(self._prefetch, weapon_id)
+
+    def _prefetch(self, weapon_id):
+        try:
+            response = self._get_weapon_response(weapon_id, IDLE)
+            if response.status_code == 200:
+                self._store_weapon(self.create_weapon_from_data(response.json()))
+                self._prefetched_ids.add(weapon_id)
+                self.prefetch_count += 1
+            # A 404 is not cached: the ids next to the last one are prefetched, and they are the ids
+            # the server gives to the next weapons added
+        except Exception:
+            pass  # Best effort: the weapon is requested normally when the user opens it
+        finally:
+            self._prefetching.discard(weapon_id)
+
+    def cache_metrics(self):
+        """
+        The function `cache_metrics` returns the hits and misses of the cache for the weapons opened by
+        the user, the hit rate, the number of prefetched weapons and how many of them were used.
+        """
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "prefetched": self.prefetch_count,
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_pending": len(self._prefetching),
+        }
+
     def load_weapon(self, weapon_id):
         """
         This function loads a weapon by sending a GET request to a specific API endpoint and emits
@@ -48,14 +415,23 @@ class WeaponPresenter(QObject):
         to load. It is used to make a request to the API endpoint to retrieve the data of the specific
         weapon with that ID
         """
+        if cached := self._fresh_entry(weapon_id):
+            self.weapon_loaded.emit(cached)
+            return
         try:
-            response = requests.get(f"http://localhost:{port_number}/api/Weapon/{weapon_id}")
+            response = self._get_weapon_response(weapon_id)
             if response.status_code == 200:
                 weapon_data = response.json()
                 weapon = self.create_weapon_from_data(weapon_data)
+                self._store_weapon(weapon)
                 self.weapon_loaded.emit(weapon)
             else:
                 self.error_occurred.emit(f"Failed to load weapon: {response.status_code}")
+        except CircuitOpenError as e:
+            # Degraded mode: show the last known state of the weapon, if any
+            if (weapon := self.weapon_cache.get(weapon_id)) is not None:
+                self.weapon_loaded.emit(weapon)
+            self.error_occurred.emit(f"{str(e)}, the last known data is displayed" if weapon else str(e))
         except Exception as e:
             self.error_occurred.emit(f"An error occurred: {str(e)}")
 
@@ -70,33 +446,153 @@ class WeaponPresenter(QObject):
         with a specific `weapon_id` exists by making a GET request to a local API endpoint. If the
         response status code is 200, it returns `True`, indicating that the weapon exists. If there is
         an error
-        :return: The function `weapon_exists` returns a boolean value indicating whether a weapon with
-        the specified `weapon_id` exists. It returns `True` if the HTTP response status code is 200
-        (indicating success), and `False` if there is an error during the request or the weapon does not
-        exist.
+        :return: The function `weapon_exists` returns `True` if the HTTP response status code is 200
+        (indicating success) and `False` if the weapon does not exist. It returns `None` if the server
+        could not be reached, unless the circuit is open and the weapon is known from the cache.
         """
+        if (cached := self._fresh_entry(weapon_id)) is not None:
+            return cached is not False
         try:
-            response = requests.get(f"http://localhost:{port_number}/api/Weapon/{weapon_id}")
+            response = self._get_weapon_response(weapon_id)
+            if response.status_code == 200:
+                self._store_weapon(self.create_weapon_from_data(response.json()))
+            elif response.status_code == 404:
+                self.absent_stamps[weapon_id] = time.monotonic()
             return response.status_code == 200
+        except CircuitOpenError:
+            return True if weapon_id in self.weapon_cache else None
         except Exception as e:
             print(f"An error occurred while checking weapon existence: {str(e)}")
-            return False
+            return None
 
     def load_all_weapons(self):
         """
         This function loads all weapons data from a specified API endpoint and emits signals based on
-        the success or failure of the operation.
+        the success or failure of the operation. The download runs in the background as a bulk request.
+        """
+        self._in_background(self._load_all_weapons)
+
+    def _load_all_weapons(self):
+        merged, errors = self._fetch_federated(BULK, on_batch=self.weapons_batch_loaded.emit)
+        for error in errors.values():
+            self.error_occurred.emit(str(error) if isinstance(error, CircuitOpenError) else f"An error occurred: {str(error)}")
+        if len(errors) == len(self.backends):
+            # Degraded mode: show the last known inventory, marked as possibly out of date
+            if self.weapon_cache and any(isinstance(error, CircuitOpenError) for error in errors.values()):
+                self.snapshot_loaded.emit(list(self.weapon_cache.values()), self.cache_time)
+            return
+        # The weapons of a failed server are not removed: its previous entries are kept, like the
+        # weapons of unknown origin (from the snapshot), which may belong to it
+        kept = {}
+        if errors:
+            kept = {weapon_id: weapon for weapon_id, weapon in self.weapon_cache.items()
+                    if weapon_id not in merged and ((origin := self.weapon_origins.get(weapon_id)) is None or origin in errors)}
+        self.cache_stamps = {**{weapon_id: self.cache_stamps[weapon_id] for weapon_id in kept if weapon_id in self.cache_stamps},
+                             **dict.fromkeys(merged, time.monotonic())}
+        self.weapon_cache = {**merged, **kept}
+        weapons = list(self.weapon_cache.values())
+        if not errors:
+            self.cache_time = time.time()
+        self._save_snapshot(weapons)
+        self.all_weapons_loaded.emit(weapons)
+        self.stale_weapons.emit(list(errors), list(kept))
+
+    def _fetch_all_weapons(self, priority, base_url=None):
+        """
+        The function `_fetch_all_weapons` downloads the whole inventory of a server.
+
+        :param priority: The priority class of the request.
+        :param base_url: The server, the primary server by default.
+        :return: The list of `Weapon` objects. An exception is raised if the server answers with an
+        error status.
+        """
+        response = self._request("GET", "/api/Weapon", priority, base_url, headers={"Accept": wire_format.accept_compact()})
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to load weapons: {response.status_code}")
+        # The body is a JSON array, or a compact format (column-oriented JSON or MessagePack)
+        # if the server supports one of those advertised in the Accept header. A very large JSON
+        # array is decoded in a process pool, so the GUI thread keeps running meanwhile.
+        return parallel_decode.decode_weapons(response.content, response.headers.get("Content-Type"))
+
+    def _fetch_federated(self, priority, on_batch=None):
+        """
+        The function `_fetch_federated` downloads the inventories of all the servers at the same time
+        and merges them as they arrive: a slow server does not delay the others. A weapon id already
+        received from another server is ignored, and the origin of every weapon is recorded.
+
+        :param priority: The priority class of the requests.
+        :param on_batch: A function called with (server, new weapons) as soon as a server answered.
+        :return: A tuple (dictionary id -> weapon in order of arrival, dictionary server -> exception
+        for the servers that failed).
+        """
+        merged, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=len(self.backends), thread_name_prefix="backend") as pool:
+            futures = {pool.submit(self._fetch_all_weapons, priority, base_url): base_url for base_url in self.backends}
+            for future in as_completed(futures):
+                base_url = futures[future]
+                try:
+                    weapons = future.result()
+                except Exception as e:
+                    errors[base_url] = e
+                    continue
+                new_weapons = [weapon for weapon in weapons if weapon.Id not in merged]
+                for weapon in new_weapons:
+                    merged[weapon.Id] = weapon
+                    self.weapon_origins[weapon.Id] = base_url
+                if on_batch is not None and new_weapons:
+                    on_batch(base_url, new_weapons)
+        return merged, errors
+
+    def _save_snapshot(self, weapons):
+        """
+        The function `_save_snapshot` saves the last full inventory for the next start. A failure only
+        costs the warm start, so it is printed and ignored.
         """
         try:
-            response = requests.get("http://localhost:{port_number}/api/Weapon")
-            if response.status_code == 200:
-                weapons_data = response.json()
-                weapons = [self.create_weapon_from_data(weapon_data) for weapon_data in weapons_data]  
-                self.all_weapons_loaded.emit(weapons)
-            else:
-                self.error_occurred.emit(f"Failed to load weapons: {response.status_code}")
+            snapshot.save_snapshot(self.snapshot_path, weapons)
         except Exception as e:
-            self.error_occurred.emit(f"An error occurred: {str(e)}")
+            print(f"An error occurred while saving the inventory snapshot: {str(e)}")
+
+    def load_snapshot(self):
+        """
+        The function `load_snapshot` emits the inventory saved by the last full load, which may be out
+        of date, and then revalidates it against the server in a background thread.
+        """
+        if (saved := snapshot.load_snapshot(self.snapshot_path)) is None:
+            return
+        weapons, saved_at = saved
+        self.weapon_cache = {weapon.Id: weapon for weapon in weapons}
+        self.cache_time = saved_at
+        self.snapshot_loaded.emit(weapons, saved_at)
+        self._in_background(self._revalidate_snapshot)
+
+    def _revalidate_snapshot(self):
+        """
+        The function `_revalidate_snapshot` downloads the inventory and emits only the weapons that
+        were added, modified or removed since the snapshot. It runs in a background thread: the signals
+        are delivered to the view in the GUI thread.
+        """
+        current, errors = self._fetch_federated(BACKGROUND)
+        for base_url, error in errors.items():
+            self.error_occurred.emit(f"An error occurred while refreshing the saved inventory of {base_url}: {str(error)}")
+        if len(errors) == len(self.backends):
+            return
+        weapons = list(current.values())
+        previous = self.weapon_cache
+        changed = [weapon for weapon in weapons
+                   if weapon.Id not in previous or vars(previous[weapon.Id]) != vars(weapon)]
+        # Without the inventory of every server, a missing weapon may belong to a failed one
+        removed_ids = [] if errors else [weapon_id for weapon_id in previous if weapon_id not in current]
+        received_at = time.monotonic()
+        self.cache_stamps.update(dict.fromkeys(current, received_at))
+        if errors:
+            current = {**previous, **current}
+        self.weapon_cache = current
+        self.cache_time = time.time()
+        if changed or removed_ids:
+            self._save_snapshot(list(current.values()))
+            self.weapons_changed.emit(changed, removed_ids)
+        self.snapshot_revalidated.emit()
 
     def add_weapon(self, weapon_data):
         """
@@ -109,9 +605,11 @@ class WeaponPresenter(QObject):
         endpoint for adding a new
         """
         try:
-            response = requests.post("http://localhost:{port_number}/api/Weapon", json=weapon_data)
+            response = self._request("POST", "/api/Weapon", json=weapon_data)
             if response.status_code == 201:
                 new_weapon_id = response.json()['id']
+                self.weapon_origins[new_weapon_id] = self.base_url
+                self.absent_stamps.pop(new_weapon_id, None)  # Its id may have been found absent before
                 self.weapon_added.emit(new_weapon_id)
             else:
                 self.error_occurred.emit(f"Failed to add weapon: {response.status_code}")
@@ -136,8 +634,11 @@ class WeaponPresenter(QObject):
         `False` after printing an error message.
         """
         try:
-            response = requests.put(f"http://localhost:{port_number}/api/Weapon/{weapon_id}", json=updated_weapon_data)
+            # Mutations go to the server owning the weapon
+            response = self._request("PUT", f"/api/Weapon/{weapon_id}", base_url=self._owner(weapon_id), json=updated_weapon_data)
             if response.status_code in {200, 204}:
+                self.weapon_cache.pop(weapon_id, None)  # The cached state is out of date
+                self.cache_stamps.pop(weapon_id, None)
                 self.weapon_updated.emit(weapon_id)
         except Exception as e:
             print(f"An error occurred while updating weapon: {str(e)}")
@@ -156,13 +657,22 @@ class WeaponPresenter(QObject):
         `create_weapon_from_data` method, which is called with the `weapon_data` obtained from the API
         response.
         """
+        if cached := self._fresh_entry(weapon_id):
+            return cached
         try:
-            response = requests.get(f"http://localhost:{port_number}/api/Weapon/{weapon_id}")
+            response = self._get_weapon_response(weapon_id)
             if response.status_code == 200:
                 weapon_data = response.json()
-                return self.create_weapon_from_data(weapon_data)  
+                weapon = self.create_weapon_from_data(weapon_data)
+                self._store_weapon(weapon)
+                return weapon
             else:
                 self.error_occurred.emit(f"Failed to load weapon details: {response.status_code}")
+        except CircuitOpenError as e:
+            # Degraded mode: the last known state of the weapon, if any
+            if (weapon := self.weapon_cache.get(weapon_id)) is not None:
+                return weapon
+            self.error_occurred.emit(str(e))
         except Exception as e:
             self.error_occurred.emit(f"An error occurred: {str(e)}")
 
@@ -177,8 +687,11 @@ class WeaponPresenter(QObject):
         corresponding weapon
         """
         try:
-            response = requests.delete(f"http://localhost:{port_number}/api/Weapon/{weapon_id}")
+            response = self._request("DELETE", f"/api/Weapon/{weapon_id}", base_url=self._owner(weapon_id))
             if response.status_code == 200:
+                self.weapon_cache.pop(weapon_id, None)
+                self.cache_stamps.pop(weapon_id, None)
+                self.weapon_origins.pop(weapon_id, None)
                 self.weapon_deleted.emit(weapon_id)
             else:
                 self.error_occurred.emit(f"Failed to delete weapon: {response.status_code}")
@@ -187,44 +700,257 @@ class WeaponPresenter(QObject):
 
     def search_keyword(self, keyword):
         """
-        The function `search_keyword` sends a request to a local API endpoint with a keyword parameter
-        and emits signals based on the response status.
-        
-        :param keyword: The `search_keyword` method is a function that sends a GET request to a local
-        API endpoint with a specific keyword parameter. The response is then checked, and if successful
-        (status code 200), the content is emitted through the `keyword_founded` signal. If there is an
-        error during the
+        The function `search_keyword` starts a keyword search on the Imagga classification endpoint.
+        The request and the parsing of the response run in a background thread, so a large response
+        does not freeze the GUI.
+
+        :param keyword: The keyword to search.
+        """
+        self._search_number += 1
+        self.search_started.emit(self._search_number, keyword)
+        self._in_background(self._run_search, self._search_number, keyword)
+
+    def _run_search(self, search_number, keyword):
+        """
+        The function `_run_search` sends the keyword search to the primary server, parses and ranks
+        the results once, and streams them to the view by chunks of `SEARCH_CHUNK_SIZE` hits, the best
+        first. The search is classified by Imagga, whose answer does not depend on the inventory of
+        the server: asking every server would only use their quota several times.
+
+        :param search_number: The number of the search, sent with every signal.
+        :param keyword: The keyword to search.
         """
         try:
-            response = requests.get(f"http://localhost:{port_number}/api/Imagga/classify?keyword={keyword}")
-            if response.status_code == 200:
-                self.keyword_founded.emit(response.content.decode('utf-8'))
-            else:
-                self.error_occurred.emit(f"Failed to retrieve weapons: {response.status_code}")
+            hits = self._search_backend(keyword)
         except Exception as e:
             self.error_occurred.emit(f"An error occurred: {str(e)}")
+            hits = []
+        for start in range(0, len(hits), SEARCH_CHUNK_SIZE):
+            if search_number != self._search_number:
+                return  # A newer search was started, stop sending these hits
+            self.search_hits_found.emit(search_number, hits[start:start + SEARCH_CHUNK_SIZE])
+        self.search_finished.emit(search_number, len(hits))
+
+    def _search_backend(self, keyword, base_url=None):
+        """
+        The function `_search_backend` sends the keyword search to a server, the primary server by
+        default, and returns its ranked hits.
+        """
+        response = self._request("GET", "/api/Imagga/classify", base_url=base_url, params={"keyword": keyword})
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to retrieve weapons: {response.status_code}")
+        return parse_search_results(response.content, keyword, origin=base_url or self.base_url)
 
     def search_openai(self, prompt):
         """
         The function `search_openai` sends a POST request to an ASP.NET server with a prompt message and
-        emits signals based on the response received.
+        emits signals based on the response received. The prompt continues the current conversation:
+        the message sent also contains the inventory digest, the summary of the older turns and the
+        last turns, within the token budget of `self.conversation`.
         
         :param prompt: The `prompt` parameter in the `search_openai` function is the message or input
         that you want to send to the OpenAI model for generating a response. It is the text that you
         provide as an input to the OpenAI model to get a response or completion based on that input
         """
-        
-        # Prepare data with prompt
-        data = {
-            "Message": prompt
-        }
+        self._in_background(self._run_openai, prompt)
+
+    def new_conversation(self):
+        """
+        The function `new_conversation` forgets the turns and the summary of the conversation.
+        """
+        self.conversation.reset()
+
+    def inventory_digest(self):
+        """
+        The function `inventory_digest` returns the digest of the loaded inventory sent as context to
+        ChatGPT. It is built again only when the inventory was replaced or changed size, or after
+        `DIGEST_MAX_AGE` seconds, instead of every turn.
+        """
+        key = (id(self.weapon_cache), len(self.weapon_cache), self.cache_time)
+        if self._digest is None or self._digest[0] != key or time.monotonic() - self._digest[1] > DIGEST_MAX_AGE:
+            digest = conversation.inventory_digest(list(self.weapon_cache.values()), self.conversation.digest_tokens)
+            self._digest = (key, time.monotonic(), digest)
+        return self._digest[2]
+
+    def _post_chatgpt(self, message, kind, priority, limits=None, **details):
+        """
+        The function `_post_chatgpt` sends a message to ChatGPT and records the size of the request and
+        of the response in the conversation, with the time it waited in the scheduler and the time from
+        its sending to the response, even if it fails.
+
+        :return: A tuple (response, recorded metrics).
+        """
+        body = json.dumps({"Message": message}).encode("utf-8")
+        timing = {}
+        start = time.perf_counter()
+
+        def record(response_bytes, status):
+            end = time.perf_counter()
+            sent_at = timing.get("sent_at", end)  # Not sent if it failed in the queue
+            return self.conversation.record(kind, len(body), response_bytes, end - sent_at,
+                                            queue_seconds=sent_at - start, status=status, **details)
 
         try:
-            response = requests.post("http://localhost:{port_number}/api/ChatGPT", json=data)
-            if response.status_code == 200:
+            response = self._request("POST", CHATGPT_PATH, priority, limits=limits, timing=timing, data=body,
+                                     headers={"Content-Type": "application/json"})
+        except Exception:
+            record(0, None)
+            raise
+        return response, record(len(response.content), response.status_code)
+
+    def _run_openai(self, prompt):
+        with self._conversation_lock:
+            message, history_turns = self.conversation.build_message(prompt, self.inventory_digest())
+            try:
+                response, metrics = self._post_chatgpt(message, "turn", INTERACTIVE, history_turns=history_turns,
+                                                       estimated_tokens=conversation.estimate_tokens(message))
+                if response.status_code != 200:
+                    self.error_occurred.emit(f"OpenAI error: {response.status_code}")
+                    return
                 result = response.json().get("response", "")
-                self.openai_founded.emit(result)
-            else:
-                self.error_occurred.emit(f"OpenAI error: {response.status_code}")
-        except Exception as e:
-            self.error_occurred.emit(f"Server connection error: {str(e)}")
+            except Exception as e:
+                self.error_occurred.emit(f"Server connection error: {str(e)}")
+                return
+            self.conversation.add_turn(prompt, result)
+            self.openai_founded.emit(result)
+            self.openai_turn_finished.emit(metrics)
+        self._summarize_conversation()
+
+    def _summarize_conversation(self):
+        """
+        The function `_summarize_conversation` folds the oldest turns into the summary once the
+        conversation exceeds its budget. ChatGPT writes the summary, in the background so the next turn
+        is not delayed; if it fails, the prompts of the turns are kept instead.
+        """
+        if not self._summary_lock.acquire(blocking=False):
+            return  # Already running, it will see the new turns next time
+        try:
+            if not (turns := self.conversation.turns_to_summarize()):
+                return
+            summary = ""
+            try:
+                response, _ = self._post_chatgpt(self.conversation.summary_request(turns), "summary", BACKGROUND,
+                                                 limits=CHATGPT_SUMMARY_LIMITS, summarized_turns=len(turns))
+                if response.status_code == 200:
+                    summary = response.json().get("response", "")
+            except Exception as e:
+                print(f"An error occurred while summarizing the conversation: {str(e)}")
+            self.conversation.fold(turns, summary or self.conversation.local_summary(turns))
+        finally:
+            self._summary_lock.release()
+
+    def classify_images(self, images):
+        """
+        The function `classify_images` starts the classification of a batch of images by the Imagga
+        endpoint of the server. The images are uploaded in the background, `CLASSIFY_CONCURRENCY` at
+        the same time, and an image whose content was already classified is answered from the cache.
+
+        :param images: The paths of local image files or the URLs of images (`Weapon.Images`).
+        :return: The number of the batch, sent with every signal.
+        """
+        images = list(dict.fromkeys(images))
+        self._classification_number += 1
+        self.classification_started.emit(self._classification_number, images)
+        self._in_background(self._run_classification, self._classification_number, images)
+        return self._classification_number
+
+    def _run_classification(self, number, images):
+        classified = failed = 0
+        with ThreadPoolExecutor(max_workers=CLASSIFY_CONCURRENCY, thread_name_prefix="classify") as pool:
+            futures = {pool.submit(self._classify_image, number, image): image for image in images}
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    hits, cached = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.image_failed.emit(number, image, str(e))
+                    continue
+                classified += 1
+                self.image_classified.emit(number, image, hits, cached)
+        try:
+            self.classification_cache.save()
+        except OSError as e:
+            # The tags were received: only the next runs will classify these images again
+            print(f"An error occurred while saving the classification cache: {str(e)}")
+        self.classification_finished.emit(number, classified, failed)
+
+    def _classify_image(self, number, image):
+        """
+        The function `_classify_image` classifies one image: an image at a URL is first downloaded to a
+        temporary file, then the digest of the file is looked up in the cache, and the file is uploaded
+        only if it is not there. The same content uploaded by another thread is waited for.
+
+        :return: A tuple (ranked `SearchHit` tags, whether they come from the cache).
+        """
+        is_url = image.startswith(("http://", "https://"))
+        path = self._download_image(image) if is_url else image
+        try:
+            digest = image_classification.file_digest(path)
+            if (results := self.classification_cache.get(digest)) is not None:
+                return self._tags_from_results(results), True
+            with self._classifying_lock:
+                upload = self._classifying.get(digest)
+                owner = upload is None
+                if owner:
+                    upload = self._classifying[digest] = Future()
+            if not owner:
+                return self._tags_from_results(upload.result()), True
+            try:
+                results = self._upload_image(number, image, path, digest)
+                self.classification_cache.put(digest, results)
+                upload.set_result(results)
+            except BaseException as e:
+                upload.set_exception(e)
+                raise
+            finally:
+                with self._classifying_lock:
+                    del self._classifying[digest]
+            return self._tags_from_results(results), False
+        finally:
+            if is_url:
+                os.remove(path)
+
+    def _download_image(self, url):
+        """
+        The function `_download_image` downloads an image by chunks to a temporary file and returns
+        its path.
+        """
+        response = self.session.get(url, stream=True, timeout=REQUEST_TIMEOUT, headers={"Accept": "image/*"})
+        with response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to download the image: {response.status_code}")
+            suffix = os.path.splitext(urlsplit(url).path)[1]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as image_file:
+                try:
+                    for chunk in response.iter_content(image_classification.UPLOAD_CHUNK_SIZE):
+                        image_file.write(chunk)
+                except BaseException:
+                    image_file.close()
+                    os.remove(image_file.name)
+                    raise
+        return image_file.name
+
+    def _upload_image(self, number, image, path, digest):
+        """
+        The function `_upload_image` streams an image file to the classification endpoint as a
+        multipart upload, emitting its progress, and returns its tags as a list of (score, fields).
+        The SHA-256 `digest` of the file identifies the upload in a cassette.
+        """
+        last_percent = -1
+
+        def on_progress(sent, size):
+            nonlocal last_percent
+            percent = 100 * sent // size if size else 100
+            if percent != last_percent:
+                last_percent = percent
+                self.image_progress.emit(number, image, percent)
+
+        body = image_classification.MultipartUpload(path, on_progress, digest=digest)
+        response = self._request("POST", CLASSIFY_PATH, BACKGROUND, data=body, headers={"Content-Type": body.content_type})
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to classify the image: {response.status_code}")
+        return [[hit.score, hit.fields] for hit in parse_search_results(response.content, "")]
+
+    def _tags_from_results(self, results):
+        return [SearchHit(rank, score, fields) for rank, (score, fields) in enumerate(results, start=1)]
@@ -0,0 +1,147 @@
+import html
+
+# Templates of the pages, compiled once: bound `str.format` methods for the page layouts and an
+# f-string function (`_build_row`, the fastest way to format the nine attributes) for the weapon row,
+# which is shared by the 'All Weapons' page and the weapon details page.
+WEAPON_DETAILS_PAGE = (
+    "<div align='center'>"
+    "<h2>Weapon Details</h2>"
+    "{0}"
+    "</div>"
+).format
+DELETE_CONFIRMATION = "Do you want to delete the following weapon?\n\n{0}".format
+DELETE_CONFIRMATION_LINE = "{0}: {1}".format
+SEARCH_RESULT = "<b>Weapon Details:</b> #{0} (relevance {1:g})<br>{2}".format
+SEARCH_RESULT_LINE = "<b>{0}:</b> {1}<br>".format
+CLASSIFICATION_TAG = "{0} ({1:.0f}%)".format
+# Number of tags displayed per classified image, the most relevant first.
+CLASSIFICATION_TAGS = 5
+CONVERSATION_SUMMARY = "<p><i>Earlier in the conversation: {0}</i></p>".format
+CONVERSATION_TURN = "<p><b>You:</b> {0}</p><p><b>ChatGPT:</b> {1}</p>".format
+CONVERSATION_METRICS = "Turn {turn}: {request_bytes:,} bytes sent (about {estimated_tokens} tokens, {history_turns} previous turns), answered in {latency_ms:.0f} ms after {queue_ms:.0f} ms in the queue".format
+
+
+# The class `WeaponRenderer` builds the rich text displayed for the weapons. The text of every weapon
+# is cached by id and formatted again only when the weapon changes, so displaying a large list again
+# does not redo the formatting. A `Weapon` is never modified: the presenter builds a new one for every
+# state received, so the object itself is the version of the text.
+class WeaponRenderer:
+    def __init__(self):
+        # Weapon id -> (weapon the text was built from, text), one dictionary per kind of text
+        self._rows = {}
+        self._delete_confirmations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, cache, weapon, build):
+        """
+        The function `_cached` returns the text of a weapon from `cache`, built by `build(weapon)` only
+        if the weapon has no text yet or if it changed since. The same object is a hit without looking
+        at its attributes; a new object with the same attributes (a weapon received again) is compared
+        once, and then a hit as well.
+        """
+        entry = cache.get(weapon.Id)
+        if entry is not None and (entry[0] is weapon or entry[0].__dict__ == weapon.__dict__):
+            self.hits += 1
+            if entry[0] is not weapon:
+                cache[weapon.Id] = (weapon, entry[1])
+            return entry[1]
+        self.misses += 1
+        text = build(weapon)
+        cache[weapon.Id] = (weapon, text)
+        return text
+
+    def row(self, weapon):
+        """
+        The function `row` returns the rich text of a weapon in the 'All Weapons' page.
+        """
+        # `_cached` inlined for the two frequent cases: the same weapon again, and a weapon never seen
+        entry = self._rows.get(weapon.Id)
+        if entry is None:
+            self.misses += 1
+            text = _build_row(weapon)
+            self._rows[weapon.Id] = (weapon, text)
+            return text
+        if entry[0] is weapon:
+            self.hits += 1
+            return entry[1]
+        return self._cached(self._rows, weapon, _build_row)
+
+    def details(self, weapon):
+        """
+        The function `details` returns the rich text of the weapon details page.
+        """
+        return WEAPON_DETAILS_PAGE(self.row(weapon))
+
+    def delete_confirmation(self, weapon):
+        """
+        The function `delete_confirmation` returns the plain text of the message box asking to confirm
+        the deletion of a weapon.
+        """
+        return self._cached(self._delete_confirmations, weapon, _build_delete_confirmation)
+
+    def search_hit(self, hit):
+        """
+        The function `search_hit` returns the rich text of one search hit: its rank, its relevance and
+        its fields displayed key by key.
+        """
+        return SEARCH_RESULT(hit.rank, hit.score, "".join(map(SEARCH_RESULT_LINE, hit.fields.keys(), hit.fields.values())))
+
+    def classification(self, tags):
+        """
+        The function `classification` returns the text of the tags of a classified image: the most
+        relevant ones with their confidence.
+        """
+        return ", ".join(CLASSIFICATION_TAG(_tag_name(tag.fields), tag.score) for tag in tags[:CLASSIFICATION_TAGS])
+
+    def conversation(self, summary, turns):
+        """
+        The function `conversation` returns the rich text of a ChatGPT conversation: the summary of the
+        older turns, then the (prompt, answer) of the last turns.
+        """
+        text = "".join(CONVERSATION_TURN(_escape(prompt), _escape(answer)) for prompt, answer in turns)
+        return (CONVERSATION_SUMMARY(_escape(summary)) if summary else "") + text
+
+    def invalidate(self, weapon_id):
+        """
+        The function `invalidate` forgets the texts of a weapon, after it was updated or deleted.
+        """
+        self._rows.pop(weapon_id, None)
+        self._delete_confirmations.pop(weapon_id, None)
+
+    def clear(self):
+        """
+        The function `clear` forgets the texts of every weapon.
+        """
+        self._rows.clear()
+        self._delete_confirmations.clear()
+
+
+def _build_row(weapon):
+    return (
+        f"<b>ID:</b> {weapon.Id}<br>"
+        f"<b>Name:</b> {weapon.Name}<br>"
+        f"<b>Type:</b> {weapon.Type}<br>"
+        f"<b>Manufacturer:</b> {weapon.Manufacturer}<br>"
+        f"<b>Caliber:</b> {weapon.Caliber}<br>"
+        f"<b>Magazine Capacity:</b> {weapon.MagazineCapacity}<br>"
+        f"<b>Fire Rate:</b> {weapon.FireRate}<br>"
+        f"<b>Ammo Count:</b> {weapon.AmmoCount}<br>"
+        f"<b>Image URL:</b> {weapon.Images}<br>"
+    )
+
+
+def _build_delete_confirmation(weapon):
+    return DELETE_CONFIRMATION("\n".join(map(DELETE_CONFIRMATION_LINE, weapon.__dict__.keys(), weapon.__dict__.values())))
+
+
+def _tag_name(fields):
+    # Imagga sends the name of a tag by language: {"tag": {"en": "rifle"}}
+    for key in ("tag", "name", "type"):
+        if (value := fields.get(key)) is not None:
+            return value.get("en", next(iter(value.values()), "")) if isinstance(value, dict) else str(value)
+    return "?"
+
+
+def _escape(text):
+    return html.escape(text).replace("\n", "<br>")
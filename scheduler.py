@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Priority classes, the lowest value is served first.
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+IDLE = 3
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", BULK: "bulk", IDLE: "idle"}
+
+
+class QueueFullError(Exception):
+    """
+    Raised by `RequestScheduler.submit` when too many requests are already waiting for an endpoint.
+    """
+
+
+def endpoint_of(path):
+    """
+    The function `endpoint_of` returns the endpoint of a request path, used as the key of the limits:
+    '/api/Imagga/classify?keyword=x' -> '/api/Imagga'.
+    """
+    return "/" + "/".join(path.split("?")[0].strip("/").split("/")[:2])
+
+
+# The class `TokenBucket` limits the rate of the requests of an endpoint: a request takes one token,
+# and `rate` tokens per second are added back, up to `capacity` (the allowed burst).
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, now):
+        """
+        The function `try_acquire` takes a token if one is available and returns whether it did.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now):
+        """
+        The function `wait_time` returns the number of seconds until a token is available.
+        """
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+# The class `RequestScheduler` runs the requests of the presenter on a pool of worker threads. Waiting
+# requests are served by priority class, then in order of arrival, as soon as their endpoint is below
+# its concurrency limit and has a token in its rate limit. A request blocked by its endpoint does not
+# block the requests of the other endpoints.
+class RequestScheduler:
+    def __init__(self, workers=8, concurrency_limits=None, rate_limits=None, max_queued=None):
+        """
+        :param workers: The maximum number of requests running at the same time.
+        :param concurrency_limits: A dictionary endpoint -> maximum number of running requests.
+        :param rate_limits: A dictionary endpoint -> (requests per second, burst).
+        :param max_queued: A dictionary endpoint -> maximum number of waiting requests, beyond which
+        `submit` raises `QueueFullError`.
+        """
+        self.workers = workers
+        self.concurrency_limits = dict(concurrency_limits or {})
+        self.buckets = {endpoint: TokenBucket(rate, burst) for endpoint, (rate, burst) in (rate_limits or {}).items()}
+        self.max_queued = dict(max_queued or {})
+
+        self._queues = {priority: deque() for priority in PRIORITY_NAMES}
+        self._running = {}  # endpoint -> number of running requests
+        self._queued = {}  # endpoint -> number of waiting requests
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="request")
+        self._closed = False
+
+        # Metrics
+        self._submitted = {priority: 0 for priority in PRIORITY_NAMES}
+        self._started = {priority: 0 for priority in PRIORITY_NAMES}
+        self._completed = {priority: 0 for priority in PRIORITY_NAMES}
+        self._total_wait = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._max_depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._rejected = 0
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="request-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, priority, endpoint, function, *args, **kwargs):
+        """
+        The function `submit` queues `function(*args, **kwargs)` for an endpoint.
+
+        :param priority: `INTERACTIVE`, `BACKGROUND`, `BULK` or `IDLE`.
+        :param endpoint: The endpoint of the request, see `endpoint_of`.
+        :return: A `concurrent.futures.Future` of the result of the function.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The request scheduler is shut down")
+            if endpoint in self.max_queued and self._queued.get(endpoint, 0) >= self.max_queued[endpoint]:
+                self._rejected += 1
+                raise QueueFullError(f"Too many requests waiting for {endpoint}, try again later")
+            queue = self._queues[priority]
+            queue.append((time.monotonic(), endpoint, future, function, args, kwargs))
+            self._queued[endpoint] = self._queued.get(endpoint, 0) + 1
+            self._submitted[priority] += 1
+            self._max_depth[priority] = max(self._max_depth[priority], len(queue))
+            self._condition.notify()
+        return future
+
+    def _next_request(self, now):
+        """
+        The function `_next_request` removes and returns the first request allowed to run, with the
+        priority it was queued with. If none is, it returns (None, seconds to wait for a token or None).
+        """
+        delay = None
+        if sum(self._running.values()) >= self.workers:
+            return None, None
+        for priority, queue in self._queues.items():
+            for index, request in enumerate(queue):
+                endpoint = request[1]
+                if self._running.get(endpoint, 0) >= self.concurrency_limits.get(endpoint, self.workers):
+                    continue
+                bucket = self.buckets.get(endpoint)
+                if bucket is not None and not bucket.try_acquire(now):
+                    wait = bucket.wait_time(now)
+                    delay = wait if delay is None else min(delay, wait)
+                    continue
+                del queue[index]
+                return (priority, request), None
+        return None, delay
+
+    def _dispatch(self):
+        with self._condition:
+            while not self._closed:
+                selected, delay = self._next_request(time.monotonic())
+                if selected is None:
+                    self._condition.wait(delay)
+                    continue
+                priority, (queued_at, endpoint, future, function, args, kwargs) = selected
+                self._queued[endpoint] -= 1
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running[endpoint] = self._running.get(endpoint, 0) + 1
+                self._started[priority] += 1
+                self._total_wait[priority] += time.monotonic() - queued_at
+                self._executor.submit(self._run, priority, endpoint, future, function, args, kwargs)
+
+    def _run(self, priority, endpoint, future, function, args, kwargs):
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._condition:
+                self._running[endpoint] -= 1
+                self._completed[priority] += 1
+                self._condition.notify()
+
+    def metrics(self):
+        """
+        The function `metrics` returns the state of the scheduler: for each priority class the number
+        of waiting requests, the highest number ever waiting, the number of submitted and completed
+        requests and the mean waiting time, and the running and waiting requests of each endpoint.
+        """
+        with self._condition:
+            return {
+                "priorities": {
+                    name: {
+                        "queue_depth": len(self._queues[priority]),
+                        "max_queue_depth": self._max_depth[priority],
+                        "submitted": self._submitted[priority],
+                        "completed": self._completed[priority],
+                        "mean_wait_ms": 1000 * self._total_wait[priority] / max(1, self._started[priority]),
+                    } for priority, name in PRIORITY_NAMES.items()
+                },
+                "running": {endpoint: count for endpoint, count in self._running.items() if count},
+                "queued": {endpoint: count for endpoint, count in self._queued.items() if count},
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        """
+        The function `shutdown` stops the dispatch of the waiting requests and waits for the running
+        ones. The futures of the waiting requests are cancelled.
+        """
+        with self._condition:
+            self._closed = True
+            for queue in self._queues.values():
+                for request in queue:
+                    request[2].cancel()
+                queue.clear()
+            self._condition.notify()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,85 @@
+import json
+
+# Keys holding a relevance given by the server, used as is when present (case insensitive).
+SCORE_KEYS = ("confidence", "score", "relevance")
+# Keys whose text weighs double when the relevance is computed from the keyword.
+TITLE_KEYS = ("name", "tag", "type")
+
+
+# The class `SearchHit` is one validated result of a keyword search: the fields sent by the server,
+# its relevance score, its rank once the results are sorted and the server it comes from. Slots keep
+# thousands of hits small.
+class SearchHit:
+    __slots__ = ("rank", "score", "fields", "origin")
+
+    def __init__(self, rank, score, fields, origin=None):
+        self.rank = rank
+        self.score = score
+        self.fields = fields
+        self.origin = origin
+
+    def key(self):
+        """
+        The function `key` identifies the result across servers: its id if it has one, otherwise all
+        its fields.
+        """
+        for id_key in ("id", "Id"):
+            if id_key in self.fields:
+                return self.fields[id_key]
+        return json.dumps(self.fields, sort_keys=True, default=str)
+
+
+def _records(payload):
+    """
+    The function `_records` returns the list of result dictionaries of a classification response:
+    a JSON array, or the raw Imagga object where the results are in 'result' -> 'tags'.
+    """
+    if isinstance(payload, dict):
+        result = payload.get("result")
+        if isinstance(result, dict) and isinstance(result.get("tags"), list):
+            return result["tags"]
+        return [payload]
+    if isinstance(payload, list):
+        return payload
+    raise ValueError(f"Unexpected search response: {type(payload).__name__}")
+
+
+def score_result(fields, keyword):
+    """
+    The function `score_result` gives the relevance of a result: the score sent by the server if
+    any, otherwise the number of occurrences of the keyword in the values, double in the names.
+
+    :param fields: The dictionary of a result.
+    :param keyword: The keyword of the search, compared case insensitively.
+    :return: The relevance as a float, higher is better.
+    """
+    for key, value in fields.items():
+        if key.lower() in SCORE_KEYS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    keyword = keyword.lower()
+    if not keyword:
+        return 0.0
+    score = 0.0
+    for key, value in fields.items():
+        occurrences = str(value).lower().count(keyword)
+        score += occurrences * 2 if key.lower() in TITLE_KEYS else occurrences
+    return score
+
+
+def parse_search_results(content, keyword, origin=None):
+    """
+    The function `parse_search_results` parses and validates the body of a keyword search once, and
+    returns the hits sorted by decreasing relevance.
+
+    :param content: The raw body of the response, JSON encoded.
+    :param keyword: The keyword of the search.
+    :param origin: The server which sent the results.
+    :return: The list of `SearchHit`, the best first, with `rank` starting at 1.
+    """
+    records = _records(json.loads(content))
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Unexpected search result: {record!r}")
+    scored = sorted(((score_result(record, keyword), index, record) for index, record in enumerate(records)),
+                    key=lambda item: (-item[0], item[1]))
+    return [SearchHit(rank, score, record, origin) for rank, (score, _, record) in enumerate(scored, start=1)]
@@ -0,0 +1,152 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from itertools import accumulate
+from model import Weapon
+
+# Snapshot file layout (little endian):
+#   header:  magic b"WPNS", format version (uint16), save time (float64), weapon count (uint32)
+#   columns: one block per `Weapon` attribute, in the order of the constructor
+#     - integer column: `count` int64 values
+#     - string column:  `count` int32 byte lengths (-1 for None) followed by the UTF-8 bytes
+# A snapshot with another magic or version is ignored, the presenter then starts empty.
+# The columns are byte-swapped on big-endian machines, so a snapshot is read the same everywhere.
+SNAPSHOT_MAGIC = b"WPNS"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<4sHdI")
+SWAP_BYTES = sys.byteorder == "big"
+
+INT_COLUMNS = ("Id", "MagazineCapacity", "FireRate", "AmmoCount")
+STRING_COLUMNS = ("Name", "Type", "Manufacturer", "Caliber", "Images")
+COLUMNS = ("Id", "Name", "Type", "Manufacturer", "Caliber", "MagazineCapacity", "FireRate", "AmmoCount", "Images")
+
+
+def cache_dir():
+    """
+    The function `cache_dir` returns the directory of the files kept by the client between two runs,
+    in the user cache directory (`$XDG_CACHE_HOME`, `~/.cache` by default).
+    """
+    user_cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(user_cache_dir, "weapon_client")
+
+
+def snapshot_path(base_url):
+    """
+    The function `snapshot_path` returns the snapshot file of a server. Each server URL has its own
+    file in the cache directory (`cache_dir`).
+    """
+    digest = hashlib.sha1(base_url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir(), f"inventory-{digest}.snap")
+
+
+def save_snapshot(path, weapons):
+    """
+    The function `save_snapshot` writes the weapons to a binary columnar snapshot file. The file is
+    written next to the old one and then renamed, so a crash never leaves a truncated snapshot.
+
+    :param path: The path of the snapshot file.
+    :param weapons: The list of `Weapon` objects of the last full load.
+    """
+    columns = [[getattr(weapon, column) for weapon in weapons] for column in COLUMNS]
+    blocks = [HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, time.time(), len(weapons)), *encode_columns(columns)]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.writelines(blocks)
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path):
+    """
+    The function `load_snapshot` reads a snapshot file written by `save_snapshot`. The file is
+    memory-mapped and every column is decoded in one pass.
+
+    :param path: The path of the snapshot file.
+    :return: A tuple (weapons, save time) or None if there is no usable snapshot.
+    """
+    try:
+        with open(path, "rb") as snapshot_file, \
+                mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, saved_at, count = HEADER.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                return None
+            columns, _ = decode_columns(data, HEADER.size, count)
+    except (OSError, ValueError, struct.error):
+        # Missing, empty or corrupted snapshot
+        return None
+    return list(map(Weapon, *columns)), saved_at
+
+
+def encode_columns(columns):
+    """
+    The function `encode_columns` encodes the columns of weapons in the binary layout of the snapshot.
+
+    :param columns: One list of values per attribute, in the order of `COLUMNS`.
+    :return: The list of the encoded blocks, to be written one after the other.
+    """
+    blocks = []
+    for column, values in zip(COLUMNS, columns):
+        if column in INT_COLUMNS:
+            blocks.append(_little_endian(array("q", values)).tobytes())
+        else:
+            encoded = [None if value is None else str(value).encode("utf-8") for value in values]
+            blocks.append(_little_endian(array("i", (-1 if data is None else len(data) for data in encoded))).tobytes())
+            blocks.append(b"".join(data for data in encoded if data))
+    return blocks
+
+
+def _little_endian(values):
+    # An array of the machine byte order converted from or to the little endian order of the file
+    if SWAP_BYTES:
+        values.byteswap()
+    return values
+
+
+def _read_array(data, offset, typecode, count):
+    """
+    The function `_read_array` reads `count` little endian integers of an array type code at `offset`.
+    It raises ValueError if `data` ends before them, like the rest of a truncated snapshot.
+    """
+    values = array(typecode)
+    values.frombytes(data[offset:offset + count * values.itemsize])
+    if len(values) != count:
+        raise ValueError("Truncated snapshot column")
+    return _little_endian(values)
+
+
+def decode_columns(data, offset, count):
+    """
+    The function `decode_columns` decodes the columns written by `encode_columns`, every column in one
+    pass.
+
+    :param data: A buffer (bytes, mmap or memoryview) containing the encoded columns.
+    :param offset: The position of the first column in `data`.
+    :param count: The number of weapons.
+    :return: A tuple (one list of values per attribute in the order of `COLUMNS`, position after the
+    last column). ValueError is raised if `data` ends before the columns of `count` weapons.
+    """
+    columns = []
+    for column in COLUMNS:
+        if column in INT_COLUMNS:
+            values = _read_array(data, offset, "q", count)
+            offset += count * values.itemsize
+            columns.append(values.tolist())
+            continue
+        lengths = _read_array(data, offset, "i", count)
+        offset += count * lengths.itemsize
+        ends = list(accumulate(max(length, 0) for length in lengths))
+        blob = bytes(data[offset:offset + (ends[-1] if ends else 0)])
+        if len(blob) != (ends[-1] if ends else 0):
+            raise ValueError("Truncated snapshot column")
+        offset += len(blob)
+        # ASCII text has one character per byte: decode the column at once and slice it
+        text = blob.decode("ascii") if blob.isascii() else blob
+        columns.append([None if length < 0 else text[end - length:end].decode("utf-8")
+                        if text is blob else text[end - length:end]
+                        for length, end in zip(lengths, ends)])
+    return columns, offset
@@ -0,0 +1,173 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from PyQt5.QtCore import QCoreApplication, Qt, QTimer
+
+# Interval of the heartbeat timer of the event loop, in milliseconds. A heartbeat late by more than
+# STALL_THRESHOLD_MS is a stall, during which the stack of the GUI thread is sampled every
+# SAMPLE_INTERVAL seconds.
+HEARTBEAT_MS = 10
+STALL_THRESHOLD_MS = 100
+SAMPLE_INTERVAL = 0.005
+# Innermost frames kept per sampled stack, stalls kept in the report, functions listed in the report.
+STACK_DEPTH = 30
+MAX_STALLS = 50
+TOP_FUNCTIONS = 20
+# Percentiles of the event loop latency in the report.
+PERCENTILES = (50, 90, 99)
+
+
+def _frame_name(frame, line):
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{line})"
+
+
+# The class `StallDetector` is a debug instrumentation of `WeaponView`, enabled with the environment
+# variable WEAPON_DEBUG_STALLS=1. A heartbeat timer measures how late the event loop runs its timers.
+# While a heartbeat is late by more than `STALL_THRESHOLD_MS`, a profiler thread samples the Python
+# stack of the GUI thread, so every stall is attributed to the functions running meanwhile. The slots
+# of the view are timed as well. The report is printed at exit.
+class StallDetector:
+    def __init__(self, threshold_ms=STALL_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = HEARTBEAT_MS / 1000
+        self.started_at = time.perf_counter()
+        self.latencies = Counter()  # Lateness of the heartbeats in milliseconds -> number
+        self.stalls = []
+        self.stall_count = 0
+        self.slots = {}  # Slot name -> [calls, total seconds, max seconds, calls over the threshold]
+        self.function_samples = Counter()  # Function -> samples where it is on the stack
+        self.self_samples = Counter()  # Function -> samples where it is the innermost frame
+        self._stall_samples = Counter()  # Stack -> samples of the current stall
+        self._lock = threading.Lock()
+        self._gui_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stopped = threading.Event()
+
+        self.heartbeat = QTimer()
+        self.heartbeat.setTimerType(Qt.PreciseTimer)
+        self.heartbeat.setInterval(HEARTBEAT_MS)
+        self.heartbeat.timeout.connect(self.on_heartbeat)
+        self.heartbeat.start()
+        threading.Thread(target=self._sample, name="stall-profiler", daemon=True).start()
+        if (app := QCoreApplication.instance()) is not None:
+            app.aboutToQuit.connect(self.print_report)
+
+    def on_heartbeat(self):
+        """
+        The function `on_heartbeat` records the lateness of the heartbeat, and ends the current stall
+        with the stacks sampled during it.
+        """
+        now = time.perf_counter()
+        lateness = max(0.0, now - self._last_beat - self.interval)
+        self._last_beat = now
+        self.latencies[round(lateness * 1000)] += 1
+        if lateness <= self.threshold:
+            return
+        with self._lock:
+            samples, self._stall_samples = self._stall_samples, Counter()
+        self.stall_count += 1
+        stack = samples.most_common(1)[0][0] if samples else ()
+        self.stalls.append({
+            "at_s": now - lateness - self.started_at,
+            "duration_ms": lateness * 1000,
+            "samples": sum(samples.values()),
+            "stack": list(stack),
+        })
+        del self.stalls[:-MAX_STALLS]
+
+    def _sample(self):
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            if time.perf_counter() - self._last_beat - self.interval <= self.threshold:
+                continue
+            frame = sys._current_frames().get(self._gui_thread)
+            stack, functions = [], []
+            while frame is not None and len(stack) < STACK_DEPTH:
+                stack.append(_frame_name(frame, frame.f_lineno))
+                functions.append(_frame_name(frame, frame.f_code.co_firstlineno))
+                frame = frame.f_back
+            if not stack:
+                continue  # The GUI thread is in Qt, outside Python code
+            with self._lock:
+                self._stall_samples[tuple(stack)] += 1
+                self.function_samples.update(set(functions))
+                self.self_samples[functions[0]] += 1
+
+    def time_slots(self, view):
+        """
+        The function `time_slots` replaces the methods of the view by timed ones. It must be called
+        before the signals are connected to them, so that the connections use the timed methods.
+        """
+        for name, function in vars(type(view)).items():
+            if inspect.isfunction(function) and not name.startswith("_") and not name.endswith("Event"):
+                setattr(view, name, self.timed(name, getattr(view, name)))
+
+    def timed(self, name, slot):
+        """
+        The function `timed` returns `slot` recording the duration of its calls under `name`. Like
+        PyQt, the extra arguments of a signal are dropped when the slot accepts fewer.
+        """
+        parameters = inspect.signature(slot).parameters.values()
+        accepted = None if any(parameter.kind == parameter.VAR_POSITIONAL for parameter in parameters) else \
+            sum(parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD) for parameter in parameters)
+
+        @functools.wraps(slot)
+        def timed_slot(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return slot(*args[:accepted], **kwargs)
+            finally:
+                self.record_slot(name, time.perf_counter() - start)
+        return timed_slot
+
+    def record_slot(self, name, seconds):
+        statistics = self.slots.setdefault(name, [0, 0.0, 0.0, 0])
+        statistics[0] += 1
+        statistics[1] += seconds
+        statistics[2] = max(statistics[2], seconds)
+        statistics[3] += seconds > self.threshold
+
+    def latency_percentile(self, percent):
+        rank, seen = sum(self.latencies.values()) * percent / 100, 0
+        for milliseconds in sorted(self.latencies):
+            seen += self.latencies[milliseconds]
+            if seen >= rank:
+                return milliseconds
+        return 0
+
+    def report(self):
+        """
+        The function `report` returns the latency of the event loop, the last stalls with the stack of
+        the GUI thread seen most often during each, the slots by total time, and the functions by time
+        spent on the stack during the stalls (estimated from the samples).
+        """
+        with self._lock:
+            function_samples, self_samples = self.function_samples.copy(), self.self_samples.copy()
+        return {
+            "heartbeats": sum(self.latencies.values()),
+            "loop_latency_ms": {**{f"p{percent}": self.latency_percentile(percent) for percent in PERCENTILES},
+                                "max": max(self.latencies, default=0)},
+            "stall_threshold_ms": self.threshold * 1000,
+            "stall_count": self.stall_count,
+            "stalls": self.stalls,
+            "slots": [{"slot": name, "calls": calls, "total_ms": total * 1000, "mean_ms": total * 1000 / calls,
+                       "max_ms": longest * 1000, "stalling_calls": stalling}
+                      for name, (calls, total, longest, stalling) in
+                      sorted(self.slots.items(), key=lambda item: item[1][1], reverse=True)],
+            "stall_functions": [{"function": function, "samples": samples, "self_samples": self_samples[function],
+                                 "estimated_ms": samples * SAMPLE_INTERVAL * 1000}
+                                for function, samples in function_samples.most_common(TOP_FUNCTIONS)],
+        }
+
+    def stop(self):
+        self.heartbeat.stop()
+        self._stopped.set()
+
+    def print_report(self):
+        self.stop()
+        json.dump(self.report(), sys.stderr, indent=2)
+        sys.stderr.write("\n")
@@ -0,0 +1,157 @@
+import time
+from collections import OrderedDict, deque
+from PyQt5.QtCore import QCoreApplication, QEvent, QObject, QTimer, pyqtSignal
+
+# Duration of a frame in milliseconds: the buffered changes are applied at most once per frame.
+FRAME_MS = 16
+# Time spent per frame applying changes to the widgets. The number of changes applied is the budget
+# divided by the measured cost of a change (moving average), FIRST_FLUSH_CHANGES before any measure.
+# The page is then laid out once, whatever the number of changes: its cost grows with the size of the
+# page, not with the changes, and is measured apart.
+APPLY_BUDGET_MS = 6
+FIRST_FLUSH_CHANGES = 20
+# Weight of the last flush in the moving average of the cost of a change.
+COST_SMOOTHING = 0.3
+
+
+# The class `UpdateCoalescer` sits between the signals of the presenter and the 'All Weapons' page.
+# It buffers the changes of the weapons, keeps only the last change of each id, and applies them at
+# most once per frame with one `changes_ready` signal (changed weapons, removed ids), as many as can be
+# applied in a time budget, so a stream of changes does not flood the event loop with one widget update per
+# weapon. The layout of the page is done within the flush, so the time measured is its real cost.
+class UpdateCoalescer(QObject):
+    changes_ready = pyqtSignal(list, list)
+
+    def __init__(self, parent=None, frame_ms=FRAME_MS, budget_ms=APPLY_BUDGET_MS):
+        super().__init__(parent)
+        self.budget_ms = budget_ms
+        self.frame_ms = frame_ms
+        self.seconds_per_change = None  # Moving average of the time to apply a change
+        self._pending = OrderedDict()  # Weapon id -> last `Weapon` state, or None if removed, the oldest first
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(frame_ms)
+        self._timer.timeout.connect(lambda: self.flush(self.budget_ms))
+
+        # Metrics
+        self.received = 0
+        self.collapsed = 0
+        self.flushes = 0
+        self.applied = 0
+        self.max_batch = 0
+        self.apply_seconds = 0.0
+        self.max_apply_seconds = 0.0
+        self.layout_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.flushes_over_frame = 0
+        self._recent = deque()  # (time, changes applied) of the flushes of the last second
+        self.max_per_second = 0
+
+    def _add(self, weapon_id, weapon):
+        self.received += 1
+        if weapon_id in self._pending:
+            self.collapsed += 1
+        self._pending[weapon_id] = weapon
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def weapon_changed(self, weapon):
+        """
+        The function `weapon_changed` buffers an added or modified weapon.
+        """
+        self._add(weapon.Id, weapon)
+
+    def weapon_removed(self, weapon_id):
+        """
+        The function `weapon_removed` buffers the removal of a weapon.
+        """
+        self._add(weapon_id, None)
+
+    def apply(self, changed_weapons, removed_ids):
+        """
+        The function `apply` buffers a batch of changes, with the arguments of `changes_ready`.
+        """
+        for weapon_id in removed_ids:
+            self._add(weapon_id, None)
+        for weapon in changed_weapons:
+            self._add(weapon.Id, weapon)
+
+    def pending_ids(self):
+        """
+        The function `pending_ids` returns the ids of the weapons with a buffered change.
+        """
+        return list(self._pending)
+
+    def flush(self, budget_ms=None):
+        """
+        The function `flush` emits `changes_ready` with the oldest buffered changes: as many as the
+        cost measured so far allows to apply in `budget_ms` milliseconds (at least one), or all of
+        them without budget. The layout requested by the changes is done right after, and measured.
+        If changes are left, the next flush is scheduled one frame later.
+        """
+        if not self._pending:
+            return
+        count = len(self._pending)
+        if budget_ms is not None:
+            budget_count = FIRST_FLUSH_CHANGES if self.seconds_per_change is None else \
+                int(budget_ms / 1000 / self.seconds_per_change)
+            count = max(1, min(count, budget_count))
+
+        start = time.perf_counter()
+        changed_weapons, removed_ids = [], []
+        for _ in range(count):
+            weapon_id, weapon = self._pending.popitem(last=False)
+            if weapon is None:
+                removed_ids.append(weapon_id)
+            else:
+                changed_weapons.append(weapon)
+        self.changes_ready.emit(changed_weapons, removed_ids)
+        applied_at = time.perf_counter()
+        # The layout of the page resizes it, which requests the layout of its scroll area: both now
+        QCoreApplication.sendPostedEvents(None, QEvent.LayoutRequest)
+        QCoreApplication.sendPostedEvents(None, QEvent.LayoutRequest)
+        end = time.perf_counter()
+        cost = (applied_at - start) / count
+        self.seconds_per_change = cost if self.seconds_per_change is None else \
+            COST_SMOOTHING * cost + (1 - COST_SMOOTHING) * self.seconds_per_change
+
+        self.flushes += 1
+        self.applied += count
+        self.max_batch = max(self.max_batch, count)
+        self.apply_seconds += applied_at - start
+        self.max_apply_seconds = max(self.max_apply_seconds, applied_at - start)
+        self.layout_seconds += end - applied_at
+        self.max_flush_seconds = max(self.max_flush_seconds, end - start)
+        self.flushes_over_frame += end - start > self.frame_ms / 1000
+        self._recent.append((start, count))
+        while self._recent[0][0] <= start - 1.0:
+            self._recent.popleft()
+        self.max_per_second = max(self.max_per_second, sum(applied for _, applied in self._recent))
+        if self._pending:
+            self._timer.start()
+        else:
+            self._timer.stop()
+
+    def metrics(self):
+        """
+        The function `metrics` returns the changes received, collapsed with a later change of the same
+        weapon and applied, the number of flushes, the time spent applying them and in the layout
+        that followed, the longest flush and the number of flushes longer than a frame, the measured
+        time to apply a change and the highest number of changes applied within one second.
+        """
+        return {
+            "received": self.received,
+            "collapsed": self.collapsed,
+            "pending": len(self._pending),
+            "applied": self.applied,
+            "flushes": self.flushes,
+            "max_batch": self.max_batch,
+            "budget_ms": self.budget_ms,
+            "apply_ms": self.apply_seconds * 1000,
+            "max_apply_ms": self.max_apply_seconds * 1000,
+            "layout_ms": self.layout_seconds * 1000,
+            "max_flush_ms": self.max_flush_seconds * 1000,
+            "flushes_over_frame": self.flushes_over_frame,
+            "ms_per_change": (self.seconds_per_change or 0.0) * 1000,
+            "max_changes_per_second": self.max_per_second,
+        }
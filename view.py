@@ -1,10 +1,19 @@
+import os
 import sys
-import json
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLineEdit, QPushButton, QLabel, QScrollArea, QMessageBox, QStackedLayout, QHBoxLayout, QGridLayout, QGroupBox
+import time
+from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLineEdit, QPushButton, QLabel, QScrollArea, QMessageBox, QStackedLayout, QHBoxLayout, QGridLayout, QGroupBox, QFileDialog, QProgressBar
 from PyQt5.QtCore import Qt
 from presenter import WeaponPresenter
+from lifecycle import LifecycleTracker
+from stall_detector import StallDetector
+from update_coalescer import UpdateCoalescer
+from prefetch import Prefetcher
+from rendering import CONVERSATION_METRICS, WeaponRenderer
 import qdarkstyle
 
+# Number of search hits displayed at first, and then each time the user asks for more.
+SEARCH_PAGE_SIZE = 20
+
 # The class `MyWidgetClass` defines a button style using CSS-like syntax for a QPushButton in PyQt.
 class MyWidgetClass:
     
@@ -41,13 +50,30 @@ class MyWidgetClass:
 # functionalities for adding, updating, deleting, searching, and displaying weapons, as well as
 # interacting with OpenAI ou Imagga.
 class WeaponView(QMainWindow):
-    def __init__(self):
+    def __init__(self, probe_server=True):
+        """
+        :param probe_server: False to leave the health probe of the server stopped, for the headless
+        checks of `bench.py`.
+        """
         super().__init__()
         self.setWindowTitle("Weapon Details")
         self.setGeometry(150, 150, 1400, 800)
 
+        # Debug instrumentation of the freezes of the event loop and of the duration of the slots,
+        # printed at exit. The slots are timed before the signals are connected to them.
+        self.stall_detector = StallDetector() if os.environ.get("WEAPON_DEBUG_STALLS") else None
+        if self.stall_detector is not None:
+            self.stall_detector.time_slots(self)
+
         self.presenter = WeaponPresenter()
 
+        # Rich text of the weapons, cached by id until the weapon changes
+        self.renderer = WeaponRenderer()
+
+        # Changes of the 'All Weapons' page, applied at most once per frame
+        self.weapon_updates = UpdateCoalescer(self)
+        self.weapon_updates.changes_ready.connect(self.apply_weapons_changes)
+
         # The above code appears to be a Python script that is calling several functions to create
         # different pages related to weapons. These functions include creating pages for getting a
         # weapon by its ID, adding a new weapon, updating a weapon, displaying all weapons, showing
@@ -59,6 +85,7 @@ class WeaponView(QMainWindow):
         self.create_weapon_details_page()
         self.create_search_page()
         self.create_openai_page()
+        self.create_classification_page()
 
         # The above code in Python is creating a `QStackedLayout` object and adding several widgets to
         # it. These widgets include `main_widget`, `add_weapon_widget`, `update_weapon_widget`,
@@ -73,6 +100,7 @@ class WeaponView(QMainWindow):
         self.stacked_layout.addWidget(self.weapon_details_widget)
         self.stacked_layout.addWidget(self.search_widget)
         self.stacked_layout.addWidget(self.openai_widget)
+        self.stacked_layout.addWidget(self.classification_widget)
 
         # The above code snippet is creating a QWidget instance called `central_widget`, setting its
         # layout to `stacked_layout`, and then setting this `central_widget` as the central widget of
@@ -88,18 +116,41 @@ class WeaponView(QMainWindow):
         # OpenAI search
         self.openai_button.clicked.connect(self.openai)
         self.presenter.openai_founded.connect(self.show_openai_page)
+        self.presenter.openai_turn_finished.connect(self.display_openai_turn)
+        self.conversation_send_button.clicked.connect(self.continue_conversation)
+        self.conversation_prompt_input.returnPressed.connect(self.continue_conversation)
+        self.new_conversation_button.clicked.connect(self.new_conversation)
         
         # Imagga search by keyword
         self.search_button.clicked.connect(self.search_keyword)
-        self.presenter.keyword_founded.connect(self.show_search_page)
+        self.presenter.search_started.connect(self.show_search_page)
+        self.presenter.search_hits_found.connect(self.add_search_hits)
+        self.presenter.search_finished.connect(self.display_search_finished)
+
+        # Image classification
+        self.classify_images_button.clicked.connect(self.choose_images_to_classify)
+        self.classify_weapon_images_button.clicked.connect(self.classify_weapon_images)
+        self.presenter.classification_started.connect(self.show_classification_page)
+        self.presenter.image_progress.connect(self.display_image_progress)
+        self.presenter.image_classified.connect(self.display_image_classified)
+        self.presenter.image_failed.connect(self.display_image_failed)
+        self.presenter.classification_finished.connect(self.display_classification_finished)
         
         # Load weapon by ID
         self.load_button.clicked.connect(self.load_weapon)
         self.presenter.weapon_loaded.connect(self.show_weapon_details_page)
+        self.presenter.weapon_loaded.connect(self.update_displayed_weapon)
         
         # Load all weapons database
         self.load_all_button.clicked.connect(self.load_all_weapons)
+        self.presenter.weapons_batch_loaded.connect(self.add_weapons_batch)
         self.presenter.all_weapons_loaded.connect(self.show_all_weapons_page)
+        self.presenter.stale_weapons.connect(self.show_stale_weapons)
+
+        # Inventory saved by the last session, then the changes found when refreshing it
+        self.presenter.snapshot_loaded.connect(self.show_snapshot_page)
+        self.presenter.weapons_changed.connect(self.weapon_updates.apply)
+        self.presenter.snapshot_revalidated.connect(self.hide_stale_notice)
         
         # Add weapon to database
         self.add_button.clicked.connect(self.show_add_weapon_page)
@@ -111,10 +162,13 @@ class WeaponView(QMainWindow):
         self.update_button.clicked.connect(self.show_update_weapon_page)
         self.update_save_button.clicked.connect(self.update_weapon)
         self.back_button_update.clicked.connect(self.show_main_page)
+        self.presenter.weapon_updated.connect(self.renderer.invalidate)
         self.presenter.weapon_updated.connect(self.display_weapon_updated_message)
         
         # Delete weapon by ID
         self.delete_button.clicked.connect(self.delete_weapon)
+        self.presenter.weapon_deleted.connect(self.renderer.invalidate)
+        self.presenter.weapon_deleted.connect(self.weapon_updates.weapon_removed)
         self.presenter.weapon_deleted.connect(self.display_weapon_deleted_message)
         
         # Error message if invalid or empty ID entered
@@ -123,8 +177,30 @@ class WeaponView(QMainWindow):
         # The code is setting the stylesheet of a PyQt5 application to use a dark theme provided by
         # the qdarkstyle library.
         self.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
-        
-        
+
+        # Health of the server in the status bar: the background probe and the circuit breakers of
+        # the presenter report when the server or one of its endpoints is unavailable
+        self.health_label = QLabel()
+        self.statusBar().addPermanentWidget(self.health_label)
+        self.open_circuits = set()
+        self.presenter.circuit_state_changed.connect(self.display_circuit_state)
+        self.presenter.server_reachable.connect(self.display_server_reachable)
+        if probe_server:
+            self.presenter.start_health_monitor()
+
+        # Effect of the prefetching in the status bar, refreshed each time the user opens a weapon
+        self.cache_label = QLabel()
+        self.statusBar().addPermanentWidget(self.cache_label)
+        self.presenter.weapon_loaded.connect(self.display_cache_metrics)
+
+        # Show the inventory of the last session right away, it is refreshed in the background
+        self.presenter.load_snapshot()
+
+        # Warms the cache of the presenter with the weapons the user is about to open
+        self.prefetcher = Prefetcher(self)
+
+        # Debug instrumentation of the widgets and of the memory of the pages, printed at exit
+        self.lifecycle = LifecycleTracker(self) if os.environ.get("WEAPON_DEBUG_LIFECYCLE") else None
 
     def create_main_page(self):
         """
@@ -179,9 +255,19 @@ class WeaponView(QMainWindow):
         self.load_all_button.setToolTip("Load all weapons in the system.")  
         self.load_all_button.setStyleSheet(MyWidgetClass.button_style)  
 
+        self.classify_images_button = QPushButton("Classify Images")
+        self.classify_images_button.setToolTip("Tag image files of your computer with Imagga.")
+        self.classify_images_button.setStyleSheet(MyWidgetClass.button_style)
+
+        self.classify_weapon_images_button = QPushButton("Classify Weapon Images")
+        self.classify_weapon_images_button.setToolTip("Tag the images of the loaded weapons with Imagga.")
+        self.classify_weapon_images_button.setStyleSheet(MyWidgetClass.button_style)
+
         # Add buttons to the actions layout
         actions_layout.addWidget(self.add_button)  # Add Weapon button
         actions_layout.addWidget(self.load_all_button)  # Load All Weapons button
+        actions_layout.addWidget(self.classify_images_button)  # Classify Images button
+        actions_layout.addWidget(self.classify_weapon_images_button)  # Classify Weapon Images button
 
         actions_groupbox.setLayout(actions_layout)  # Apply the layout for the group box
 
@@ -237,6 +323,53 @@ class WeaponView(QMainWindow):
         """
         print(f"Error: {error_message}")
         
+    def display_server_reachable(self, reachable):
+        """
+        The function `display_server_reachable` updates the health indicator with the result of the
+        background probe of the server.
+
+        :param reachable: Whether the server answered the probe.
+        """
+        if not reachable:
+            self.health_label.setStyleSheet("color: red;")
+            self.health_label.setText("Server offline, showing the last known data")
+        elif self.open_circuits:
+            self.display_circuit_state(None, None)
+        else:
+            self.health_label.setStyleSheet("color: lightgreen;")
+            self.health_label.setText("Server online")
+
+    def display_circuit_state(self, endpoint, state):
+        """
+        The function `display_circuit_state` updates the health indicator when the circuit breaker of
+        an endpoint changes, listing the endpoints whose requests currently fail fast.
+
+        :param endpoint: The endpoint of the circuit breaker, or None to only refresh the indicator.
+        :param state: The new state of the circuit: 'closed', 'open' or 'half-open'.
+        """
+        if endpoint is not None:
+            if state == "closed":
+                self.open_circuits.discard(endpoint)
+            else:
+                self.open_circuits.add(endpoint)
+        if self.open_circuits:
+            self.health_label.setStyleSheet("color: orange;")
+            self.health_label.setText("Unavailable: " + ", ".join(sorted(self.open_circuits)))
+        else:
+            self.display_server_reachable(True)
+
+
+    def display_cache_metrics(self):
+        """
+        The function `display_cache_metrics` shows in the status bar how many of the weapons opened by
+        the user came from the cache of the presenter, and how many prefetched weapons were used.
+        """
+        metrics = self.presenter.cache_metrics()
+        lookups = metrics["hits"] + metrics["misses"]
+        self.cache_label.setText(f"Cache: {metrics['hits']}/{lookups} opened without a request "
+                                 f"({metrics['hit_rate']:.0%}), {metrics['prefetch_hits']}/{metrics['prefetched']} "
+                                 f"prefetched weapons used")
+
 
 # OpenAI region ------------------------------------------------
 
@@ -249,8 +382,35 @@ class WeaponView(QMainWindow):
         self.openai_widget = QWidget()
         layout = QVBoxLayout()
         self.openai_widget.setLayout(layout)
+
+        # The conversation so far, the last turn at the bottom
+        self.conversation_scroll_area = QScrollArea()
+        self.conversation_scroll_area.setWidgetResizable(True)
         self.result_label = QLabel()
-        layout.addWidget(self.result_label)
+        self.result_label.setWordWrap(True)
+        self.result_label.setAlignment(Qt.AlignTop)
+        self.result_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.conversation_scroll_area.setWidget(self.result_label)
+        self.conversation_scroll_area.verticalScrollBar().rangeChanged.connect(self._scroll_conversation_to_end)
+        layout.addWidget(self.conversation_scroll_area)
+
+        # Size and latency of the last turn
+        self.conversation_metrics_label = QLabel()
+        layout.addWidget(self.conversation_metrics_label)
+
+        # Next prompt of the conversation
+        prompt_layout = QHBoxLayout()
+        self.conversation_prompt_input = QLineEdit()
+        self.conversation_prompt_input.setPlaceholderText("Continue the conversation")
+        self.conversation_send_button = QPushButton("Send")
+        self.conversation_send_button.setStyleSheet(MyWidgetClass.button_style)
+        self.new_conversation_button = QPushButton("New Conversation")
+        self.new_conversation_button.setStyleSheet(MyWidgetClass.button_style)
+        prompt_layout.addWidget(self.conversation_prompt_input)
+        prompt_layout.addWidget(self.conversation_send_button)
+        prompt_layout.addWidget(self.new_conversation_button)
+        layout.addLayout(prompt_layout)
+
         back_to_main_button = QPushButton("Back to Main")
         back_to_main_button.setStyleSheet(MyWidgetClass.button_style)
         layout.addWidget(back_to_main_button)
@@ -275,9 +435,153 @@ class WeaponView(QMainWindow):
         `result_label` widget to the content provided in the `result` parameter and then switches the
         current index of
         """
-        self.result_label.setText(result)
+        self.result_label.setText(self.renderer.conversation(*self.presenter.conversation.transcript()))
         self.stacked_layout.setCurrentIndex(6)
 
+    def _scroll_conversation_to_end(self, minimum, maximum):
+        self.conversation_scroll_area.verticalScrollBar().setValue(maximum)
+
+    def continue_conversation(self):
+        """
+        The function `continue_conversation` sends the prompt typed on the OpenAI page as the next turn
+        of the conversation.
+        """
+        if prompt := self.conversation_prompt_input.text().strip():
+            self.conversation_prompt_input.clear()
+            self.presenter.search_openai(prompt)
+
+    def new_conversation(self):
+        """
+        The function `new_conversation` starts a new conversation with ChatGPT.
+        """
+        self.presenter.new_conversation()
+        self.result_label.clear()
+        self.conversation_metrics_label.clear()
+
+    def display_openai_turn(self, metrics):
+        """
+        The function `display_openai_turn` displays the size and the latency of the last turn.
+
+        :param metrics: The metrics of the turn recorded by `ConversationSession.record`.
+        """
+        self.conversation_metrics_label.setText(CONVERSATION_METRICS(**metrics))
+
+
+# Classification region ------------------------------------------------
+
+    def create_classification_page(self):
+        """
+        The function creates the page of an image classification, with one row per image: its name,
+        the progress of its upload and its tags once classified.
+        """
+        self.classification_widget = QWidget()
+        layout = QVBoxLayout()
+        self.classification_widget.setLayout(layout)
+
+        # Number of images of the batch and of the images classified
+        self.classification_status_label = QLabel()
+        layout.addWidget(self.classification_status_label)
+
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        rows_widget = QWidget()
+        self.classification_layout = QGridLayout()
+        self.classification_layout.setAlignment(Qt.AlignTop)
+        rows_widget.setLayout(self.classification_layout)
+        scroll_area.setWidget(rows_widget)
+        layout.addWidget(scroll_area)
+
+        # Image -> (name label, progress bar, result label) of the current batch
+        self.classification_number = 0
+        self.classification_rows = {}
+
+        back_to_main_button = QPushButton("Back to Main")
+        back_to_main_button.setStyleSheet(MyWidgetClass.button_style)
+        layout.addWidget(back_to_main_button)
+        back_to_main_button.clicked.connect(self.show_main_page)
+
+    def choose_images_to_classify(self):
+        """
+        The function `choose_images_to_classify` asks the user for image files and classifies them.
+        """
+        paths, _ = QFileDialog.getOpenFileNames(self, "Classify Images", "", "Images (*.png *.jpg *.jpeg *.gif *.bmp *.webp)")
+        if paths:
+            self.presenter.classify_images(paths)
+
+    def classify_weapon_images(self):
+        """
+        The function `classify_weapon_images` classifies the images of the weapons loaded so far.
+        """
+        images = [weapon.Images for weapon in self.presenter.weapon_cache.values() if weapon.Images]
+        if not images:
+            QMessageBox.warning(self, 'Error', "Load the weapons first, none of the loaded weapons has an image.")
+            return
+        self.presenter.classify_images(images)
+
+    def show_classification_page(self, number, images):
+        """
+        The function `show_classification_page` replaces the rows of the previous batch by one row per
+        image of a new batch, and switches to the classification page.
+
+        :param number: The number of the batch.
+        :param images: The paths or URLs of the images.
+        """
+        self.classification_number = number
+        for widgets in self.classification_rows.values():
+            for widget in widgets:
+                self.classification_layout.removeWidget(widget)
+                widget.deleteLater()
+        self.classification_rows = {}
+        for row, image in enumerate(images):
+            name_label = QLabel(os.path.basename(image.rstrip("/")) or image)
+            name_label.setToolTip(image)
+            progress_bar = QProgressBar()
+            result_label = QLabel("Waiting...")
+            result_label.setWordWrap(True)
+            self.classification_layout.addWidget(name_label, row, 0)
+            self.classification_layout.addWidget(progress_bar, row, 1)
+            self.classification_layout.addWidget(result_label, row, 2)
+            self.classification_rows[image] = (name_label, progress_bar, result_label)
+        self.classification_status_label.setText(f"Classifying {len(images)} images...")
+        self.stacked_layout.setCurrentIndex(7)
+
+    def display_image_progress(self, number, image, percent):
+        """
+        The function `display_image_progress` displays the upload progress of an image.
+        """
+        if number == self.classification_number and (row := self.classification_rows.get(image)):
+            row[1].setValue(percent)
+            row[2].setText("Uploading...")
+
+    def display_image_classified(self, number, image, tags, cached):
+        """
+        The function `display_image_classified` displays the tags of a classified image.
+
+        :param tags: The ranked `SearchHit` tags of the image.
+        :param cached: Whether the tags come from the cache, without upload.
+        """
+        if number == self.classification_number and (row := self.classification_rows.get(image)):
+            row[1].setValue(100)
+            text = self.renderer.classification(tags) or "No tags"
+            row[2].setText(f"{text} (cached)" if cached else text)
+
+    def display_image_failed(self, number, image, error):
+        """
+        The function `display_image_failed` displays the error of an image which was not classified.
+        """
+        if number == self.classification_number and (row := self.classification_rows.get(image)):
+            row[1].setFormat("Failed")
+            row[2].setText(error)
+            row[2].setStyleSheet("color: red;")
+
+    def display_classification_finished(self, number, classified, failed):
+        """
+        The function `display_classification_finished` displays the number of images classified and
+        failed once the whole batch is done.
+        """
+        if number == self.classification_number:
+            self.classification_status_label.setText(f"{classified} images classified, {failed} failed.")
+
 
 # Search region ------------------------------------------------
 
@@ -292,13 +596,17 @@ class WeaponView(QMainWindow):
 
     def create_search_page(self):
         """
-        The function creates a search page with a scrollable area to display search results and a button
-        to go back to the main page.
+        The function creates a search page with a scrollable area to display search results, a button
+        to display more results and a button to go back to the main page.
         """
         self.search_widget = QWidget()
         layout = QVBoxLayout()  # Disposition verticale
         self.search_widget.setLayout(layout)
 
+        # Keyword of the search and number of results
+        self.search_status_label = QLabel()
+        layout.addWidget(self.search_status_label)
+
         # Create a scroll area to display search results
         self.result_scroll_area = QScrollArea()
         # The widget will adjust its size automatically to fit its contents,
@@ -308,51 +616,99 @@ class WeaponView(QMainWindow):
         self.result_layout = QVBoxLayout()  # Results display
         self.result_widget.setLayout(self.result_layout)
         self.result_scroll_area.setWidget(self.result_widget)  
+        # Display the next results when the user scrolls to the bottom
+        self.result_scroll_area.verticalScrollBar().valueChanged.connect(self.on_search_scrolled)
 
-        # Add result and back button
+        # Ranked hits of the current search, only the first `search_displayed` have a label
+        self.search_number = 0
+        self.search_hits = []
+        self.search_displayed = 0
+
+        # Add result, more and back buttons
         layout.addWidget(self.result_scroll_area)
+        self.more_results_button = QPushButton("Show More Results")
+        self.more_results_button.setStyleSheet(MyWidgetClass.button_style)
+        self.more_results_button.hide()
+        self.more_results_button.clicked.connect(lambda: self.show_more_search_hits())
+        layout.addWidget(self.more_results_button)
         back_to_main_button = QPushButton("Back to Main")
         back_to_main_button.setStyleSheet(MyWidgetClass.button_style)
         
         layout.addWidget(back_to_main_button)
         back_to_main_button.clicked.connect(self.show_main_page)  
 
-    def show_search_page(self, result):
+    def show_search_page(self, search_number, keyword):
         """
-        The function `show_search_page` displays search results in a PyQt application, handling JSON
-        data and potential errors.
-        
-        :param result: The `result` parameter in the `show_search_page` method is expected to be a JSON
-        string representing a dictionnary of weapons. This JSON string will be converted into a Python list of
-        dictionaries where each dictionary represents the details of a weapon
+        The function `show_search_page` clears the results of the previous search and displays the
+        search page while the presenter is searching.
+
+        :param search_number: The number of the search started by the presenter.
+        :param keyword: The keyword of the search.
         """
-        try:
-            # Reinitialize the page for avoiding doubles of prevous searches
-            for i in reversed(range(self.result_layout.count())):
-                self.result_layout.itemAt(i).widget().deleteLater()
+        # Reinitialize the page for avoiding doubles of prevous searches
+        for i in reversed(range(self.result_layout.count())):
+            self.result_layout.itemAt(i).widget().deleteLater()
 
-            # Convert JSON into weapons dictionnary
-            weapons_list = json.loads(result)
+        self.search_number = search_number
+        self.search_hits = []
+        self.search_displayed = 0
+        self.more_results_button.hide()
+        self.search_status_label.setText(f"Searching for '{keyword}'...")
 
-            for weapon in weapons_list:
-                weapon_info = "<b>Weapon Details:</b><br>"
-                for key, value in weapon.items():
-                    weapon_info += f"<b>{key}:</b> {value}<br>"
+        # Display search page
+        self.stacked_layout.setCurrentIndex(5)
 
-                weapon_label = QLabel()
-                weapon_label.setTextInteractionFlags(Qt.TextSelectableByMouse)  # Allow to select text
-                weapon_label.setText(weapon_info)
+    def add_search_hits(self, search_number, hits):
+        """
+        The function `add_search_hits` receives the next ranked hits of a search. The first
+        `SEARCH_PAGE_SIZE` hits are displayed right away, the others when the user asks for them.
 
-                # Add label to layout
-                self.result_layout.addWidget(weapon_label)
+        :param search_number: The number of the search of these hits, older searches are ignored.
+        :param hits: The list of `SearchHit`, in ranked order.
+        """
+        if search_number != self.search_number:
+            return
+        # The hits of each server are ranked, keep the hits not displayed yet ranked across servers
+        self.search_hits[self.search_displayed:] = sorted(self.search_hits[self.search_displayed:] + hits,
+                                                          key=lambda hit: -hit.score)
+        if self.search_displayed < SEARCH_PAGE_SIZE:
+            self.show_more_search_hits(SEARCH_PAGE_SIZE - self.search_displayed)
+        self.more_results_button.setVisible(self.search_displayed < len(self.search_hits))
+
+    def show_more_search_hits(self, count=SEARCH_PAGE_SIZE):
+        """
+        The function `show_more_search_hits` creates the labels of the next hits of the search.
 
-            # Display search page
-            self.stacked_layout.setCurrentIndex(5)
-            
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            error_label = QLabel(error_message)
-            self.result_layout.addWidget(error_label)
+        :param count: The maximum number of hits to display.
+        """
+        for hit in self.search_hits[self.search_displayed:self.search_displayed + count]:
+            weapon_label = QLabel()
+            weapon_label.setTextInteractionFlags(Qt.TextSelectableByMouse)  # Allow to select text
+            weapon_label.setText(self.renderer.search_hit(hit))
+            if hit.origin:
+                weapon_label.setToolTip(f"Server: {hit.origin}")
+
+            # Add label to layout
+            self.result_layout.addWidget(weapon_label)
+            self.search_displayed += 1
+        self.more_results_button.setVisible(self.search_displayed < len(self.search_hits))
+
+    def on_search_scrolled(self, value):
+        """
+        The function `on_search_scrolled` displays the next hits when the results are scrolled to the
+        bottom.
+        """
+        if value == self.result_scroll_area.verticalScrollBar().maximum() and self.search_displayed < len(self.search_hits):
+            self.show_more_search_hits()
+
+    def display_search_finished(self, search_number, hits_count):
+        """
+        The function `display_search_finished` displays the number of results once every hit of the
+        search was received.
+        """
+        if search_number != self.search_number:
+            return
+        self.search_status_label.setText(f"{hits_count} result(s)" if hits_count else "No result found.")
     
 # Add region ------------------------------------------------
     def create_add_weapon_page(self):
@@ -530,7 +886,10 @@ class WeaponView(QMainWindow):
             QMessageBox.warning(self, 'Error', "Please enter a valid weapon ID.")
             self.weapon_id_input.clear()
             return
-        if not self.presenter.weapon_exists(int(weapon_id)):
+        if (exists := self.presenter.weapon_exists(int(weapon_id))) is None:
+            QMessageBox.warning(self, 'Error', "The server is unavailable, please try again later.")
+            return
+        if not exists:
             QMessageBox.warning(self, 'Error', f"Weapon with ID {weapon_id} does not exist.")
             self.weapon_id_input.clear()
             return
@@ -591,20 +950,30 @@ class WeaponView(QMainWindow):
 # Load all region ------------------------------------------------
     def create_all_weapons_page(self):
         """
-        Creates the page to display all loaded weapons with a grid layout and a scroll area.
+        Creates the page to display all loaded weapons with a single-column layout and a scroll area.
         """
         self.all_weapons_widget = QWidget()
 
+        # Notice shown while the displayed inventory comes from the last session
+        self.stale_label = QLabel()
+        self.stale_label.setStyleSheet("color: orange;")
+        self.stale_label.hide()
+
         # Scroll area for displaying all weapons
         self.scroll_area = QScrollArea() 
         self.scroll_area.setWidgetResizable(True)  
 
-        # Widget for the content of the scroll area
+        # Widget for the content of the scroll area, with one label per weapon id
         self.scroll_content_widget = QWidget()  
-        self.scroll_layout = QGridLayout()  
+        self.scroll_layout = QVBoxLayout()  
+        self.weapon_labels = {}
+        self.weapon_label_texts = {}  # Text displayed by each label, to skip unchanged weapons
+        self.streamed_ids = set()  # Weapons of the running full load already received by batches
+        self.stale_ids = set()  # Weapons kept from the previous load of a server which did not answer
 
         # Set the layout for the scroll content widget
         layout = QVBoxLayout() 
+        layout.addWidget(self.stale_label)
         layout.addWidget(self.scroll_area)  # Add scroll area
 
         # Back button
@@ -624,45 +993,144 @@ class WeaponView(QMainWindow):
 
     def show_all_weapons_page(self, weapons):
         """
-        Displays all loaded weapons in the 'All Weapons' page using a single-column layout.
+        Displays all loaded weapons in the 'All Weapons' page. The labels of the weapons already
+        displayed are reused, only the new, modified and removed weapons touch the widgets, frame by
+        frame through `weapon_updates`.
         """
         self.stacked_layout.setCurrentIndex(3)  # Switch to the 'All Weapons' page
+        self.hide_stale_notice()
+        self._fill_all_weapons_page(weapons)
 
-        # Create a new vertical layout to avoid potential conflicts
-        single_column_layout = QVBoxLayout()  
-
-        # Iterate over the weapons and create labels for each
-        for weapon in weapons:
-            # Create a label with detailed information about each weapon
-            weapon_label = QLabel()  
-            weapon_text = (
-                f"<b>ID:</b> {weapon.Id}<br>"
-                f"<b>Name:</b> {weapon.Name}<br>"
-                f"<b>Type:</b> {weapon.Type}<br>"
-                f"<b>Manufacturer:</b> {weapon.Manufacturer}<br>"
-                f"<b>Caliber:</b> {weapon.Caliber}<br>"
-                f"<b>Magazine Capacity:</b> {weapon.MagazineCapacity}<br>"
-                f"<b>Fire Rate:</b> {weapon.FireRate}<br>"
-                f"<b>Ammo Count:</b> {weapon.AmmoCount}<br>"
-                f"<b>Image URL:</b> {weapon.Images}<br>"
-            )
-            weapon_label.setText(weapon_text)  
-            weapon_label.setTextInteractionFlags(Qt.TextSelectableByMouse)  # Allow text selection
-
-            # Add the label to the single-column layout
-            single_column_layout.addWidget(weapon_label)  # Add the label to the layout
-
-        # Recreate the scroll content widget to avoid conflicts
-        self.scroll_content_widget = QWidget()  
-        self.scroll_content_widget.setLayout(single_column_layout)  # Apply the new layout
+    def _fill_all_weapons_page(self, weapons):
+        """
+        The function `_fill_all_weapons_page` buffers the changes turning the rows of the 'All Weapons'
+        page into `weapons`, without switching to the page.
+        """
+        # The weapons streamed by `add_weapons_batch` are already buffered, only the others and the
+        # removals are left: the weapons displayed or still buffered which are not in the load
+        loaded_ids = {weapon.Id for weapon in weapons}
+        removed_ids = {weapon_id for weapon_id in self.weapon_labels if weapon_id not in loaded_ids}
+        removed_ids.update(weapon_id for weapon_id in self.weapon_updates.pending_ids() if weapon_id not in loaded_ids)
+        self.weapon_updates.apply([weapon for weapon in weapons if weapon.Id not in self.streamed_ids],
+                                  list(removed_ids))
+        self.streamed_ids = set()
+
+    def add_weapons_batch(self, origin, weapons):
+        """
+        The function `add_weapons_batch` displays the weapons of one server as soon as it answered,
+        without waiting for the other servers. The tooltip of each weapon gives its server (see
+        `apply_weapons_changes`).
+
+        :param origin: The URL of the server of these weapons.
+        :param weapons: The list of `Weapon` objects not already received from another server.
+        """
+        self.stacked_layout.setCurrentIndex(3)  # Switch to the 'All Weapons' page
+        self.streamed_ids.update(weapon.Id for weapon in weapons)
+        self.weapon_updates.apply(weapons, [])
+
+    def show_snapshot_page(self, weapons, saved_at):
+        """
+        The function `show_snapshot_page` fills the 'All Weapons' page with the inventory saved by the
+        last session, with a notice saying that it may be out of date until the presenter has refreshed
+        it. The current page is not changed.
+
+        :param weapons: The list of `Weapon` objects of the snapshot.
+        :param saved_at: The time (seconds since the epoch) when the snapshot was saved.
+        """
+        self._fill_all_weapons_page(weapons)
+        saved_text = time.strftime("%Y-%m-%d %H:%M", time.localtime(saved_at))
+        self.stale_label.setText(f"Inventory saved on {saved_text}, it may be out of date.")
+        self.stale_label.show()
+
+    def show_stale_weapons(self, servers, weapon_ids):
+        """
+        The function `show_stale_weapons` marks the weapons kept from the previous load of the servers
+        which did not answer the last full load: their rows are grayed and the notice of the page names
+        the servers. The rows of the weapons no longer stale get back their normal look.
 
-        # Reassign the scroll content widget to the scroll area
-        self.scroll_area.setWidget(self.scroll_content_widget)  # Set the new content widget
+        :param servers: The URLs of the servers which did not answer.
+        :param weapon_ids: The ids of the weapons kept from their previous load.
+        """
+        previous_ids, self.stale_ids = self.stale_ids, set(weapon_ids)
+        for weapon_id in previous_ids ^ self.stale_ids:
+            if (weapon_label := self.weapon_labels.get(weapon_id)) is not None:
+                self._mark_weapon_label(weapon_id, weapon_label)
+        if servers:
+            self.stale_label.setText(f"Not answering: {', '.join(servers)}. {len(weapon_ids)} weapons (grayed) "
+                                     f"are kept from the previous load and may be out of date.")
+            self.stale_label.show()
+
+    def _mark_weapon_label(self, weapon_id, weapon_label):
+        """
+        The function `_mark_weapon_label` sets the tooltip of a weapon row to its server, and grays the
+        row if the weapon is stale (see `show_stale_weapons`).
+        """
+        origin = self.presenter.weapon_origins.get(weapon_id)
+        if weapon_id in self.stale_ids:
+            weapon_label.setToolTip(f"Server: {origin or 'unknown'}, not answering: may be out of date")
+            weapon_label.setStyleSheet("color: gray;")
+        else:
+            weapon_label.setToolTip(f"Server: {origin}" if origin is not None else "")
+            if weapon_label.styleSheet():
+                weapon_label.setStyleSheet("")
+
+    def hide_stale_notice(self):
+        """
+        The function `hide_stale_notice` hides the notice of the 'All Weapons' page once the displayed
+        inventory is up to date.
+        """
+        self.stale_label.hide()
+
+    def apply_weapons_changes(self, changed_weapons, removed_ids):
+        """
+        The function `apply_weapons_changes` updates the 'All Weapons' page with only the differences:
+        labels of new weapons are appended, labels of modified weapons get their new text and labels of
+        removed weapons are deleted. It is connected to `weapon_updates`, which calls it once per frame
+        or a few times by small chunks, with the changes buffered meanwhile.
+
+        :param changed_weapons: The list of added or modified `Weapon` objects.
+        :param removed_ids: The list of ids of the removed weapons.
+        """
+        # While the labels are added and shown, the layout is disabled: showing a label in an active
+        # layout lays out all the others again. It is laid out once at the end.
+        self.scroll_layout.setEnabled(False)
+        for weapon_id in removed_ids:
+            self.renderer.invalidate(weapon_id)
+            self.weapon_label_texts.pop(weapon_id, None)
+            if (weapon_label := self.weapon_labels.pop(weapon_id, None)) is not None:
+                self.scroll_layout.removeWidget(weapon_label)
+                weapon_label.deleteLater()
+
+        for weapon in changed_weapons:
+            # Detailed information about the weapon, formatted again only if it changed
+            weapon_text = self.renderer.row(weapon)
+            if (weapon_label := self.weapon_labels.get(weapon.Id)) is None:
+                weapon_label = QLabel()  
+                weapon_label.setTextInteractionFlags(Qt.TextSelectableByMouse)  # Allow text selection
+                self.scroll_layout.addWidget(weapon_label)  # Add the label to the layout
+                weapon_label.show()  # Now rather than by a queued call, which would lay out the page
+                self.weapon_labels[weapon.Id] = weapon_label
+                self._mark_weapon_label(weapon.Id, weapon_label)
+            if self.weapon_label_texts.get(weapon.Id) is not weapon_text:
+                weapon_label.setText(weapon_text)  
+                self.weapon_label_texts[weapon.Id] = weapon_text
+        self.scroll_layout.setEnabled(True)
+        self.scroll_layout.update()
+
+    def update_displayed_weapon(self, weapon):
+        """
+        The function `update_displayed_weapon` refreshes the row of a weapon just loaded, if it is
+        displayed in the 'All Weapons' page.
+        """
+        if weapon.Id in self.weapon_labels:
+            self.weapon_updates.weapon_changed(weapon)
 
     def load_all_weapons(self):
         """
-        The function `load_all_weapons` calls the `load_all_weapons` method of the `presenter` object.
+        The function `load_all_weapons` switches to the 'All Weapons' page, which shows the weapons
+        already known, and calls the `load_all_weapons` method of the `presenter` object.
         """
+        self.stacked_layout.setCurrentIndex(3)  # Switch to the 'All Weapons' page
         self.presenter.load_all_weapons()
 
 
@@ -681,7 +1149,10 @@ class WeaponView(QMainWindow):
             QMessageBox.warning(self, 'Error', "Please enter a valid weapon ID.")
             self.weapon_id_input.clear()
             return
-        if not self.presenter.weapon_exists(int(weapon_id)):
+        if (exists := self.presenter.weapon_exists(int(weapon_id))) is None:
+            QMessageBox.warning(self, 'Error', "The server is unavailable, please try again later.")
+            return
+        if not exists:
             QMessageBox.warning(self, 'Error', f"Weapon with ID {weapon_id} does not exist.")
             self.weapon_id_input.clear()
             return
@@ -693,23 +1164,8 @@ class WeaponView(QMainWindow):
         """
         self.stacked_layout.setCurrentIndex(4)  # Index of the weapon details page
 
-        # Construct the text to display the weapon details
-        details_text = (
-        "<div align='center'>"
-        "<h2>Weapon Details</h2>"
-        f"<b>ID:</b> {weapon.Id}<br>"
-        f"<b>Name:</b> {weapon.Name}<br>"
-        f"<b>Type:</b> {weapon.Type}<br>"
-        f"<b>Manufacturer:</b> {weapon.Manufacturer}<br>"
-        f"<b>Caliber:</b> {weapon.Caliber}<br>"
-        f"<b>Magazine Capacity:</b> {weapon.MagazineCapacity}<br>"
-        f"<b>Fire Rate:</b> {weapon.FireRate}<br>"
-        f"<b>Ammo Count:</b> {weapon.AmmoCount}<br>"
-        f"<b>Image URL:</b> {weapon.Images}<br>"
-        "</div>"
-        )
-        # Set the text to the label
-        self.weapon_details_label.setText(details_text)
+        # Set the text of the weapon details to the label
+        self.weapon_details_label.setText(self.renderer.details(weapon))
 
     def create_weapon_details_page(self):
         """
@@ -750,14 +1206,16 @@ class WeaponView(QMainWindow):
             QMessageBox.warning(self, 'Error', "Please enter a valid weapon ID.")
             self.weapon_id_input.clear()
             return
-        if not self.presenter.weapon_exists(int(weapon_id)):
+        if (exists := self.presenter.weapon_exists(int(weapon_id))) is None:
+            QMessageBox.warning(self, 'Error', "The server is unavailable, please try again later.")
+            return
+        if not exists:
             QMessageBox.warning(self, 'Error', f"Weapon with ID {weapon_id} does not exist.")
             self.weapon_id_input.clear()
             return
         # Get the weapon details to display them in the message box
         if (weapon_details := self.presenter.load_weapon_details(int(weapon_id))):
-            details_text = "\n".join([f"{attribute}: {value}" for attribute, value in weapon_details.__dict__.items()])
-            confirmation = QMessageBox.question(self, 'Confirmation', f"Do you want to delete the following weapon?\n\n{details_text}", QMessageBox.Yes | QMessageBox.No)
+            confirmation = QMessageBox.question(self, 'Confirmation', self.renderer.delete_confirmation(weapon_details), QMessageBox.Yes | QMessageBox.No)
             if confirmation == QMessageBox.Yes:
                 self.presenter.delete_weapon(int(weapon_id))
         self.weapon_id_input.clear()
@@ -774,9 +1232,16 @@ class WeaponView(QMainWindow):
         QMessageBox.information(self, 'Success', f"Weapon deleted successfully with ID: {weapon_id}")
 
 
-if __name__ == "__main__":
+def main():
+    """
+    The function `main` starts the application: it shows the window and runs the event loop.
+    """
     app = QApplication(sys.argv)
     app.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
     view = WeaponView()
     view.show()
     sys.exit(app.exec_())
+
+
+if __name__ == "__main__":
+    main()
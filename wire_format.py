@@ -0,0 +1,143 @@
+import gzip
+import json
+from model import Weapon
+
+# MessagePack and Brotli are optional: the client only advertises what it can decode.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Content types understood by the client for the weapon collection, most compact first.
+MSGPACK_TYPE = "application/x-msgpack"
+COLUMNS_TYPE = "application/vnd.weapon.columns+json"
+JSON_TYPE = "application/json"
+
+# The JSON keys of a weapon, in the order of the `Weapon` constructor arguments.
+WEAPON_FIELDS = ("id", "name", "type", "manufacturer", "caliber",
+                 "magazineCapacity", "fireRate", "ammoCount", "images")
+
+
+def accept_encoding():
+    """
+    The function `accept_encoding` builds the `Accept-Encoding` header value for the compressions
+    that can be decoded by the HTTP stack installed on this machine.
+    """
+    encodings = ["gzip", "deflate"]
+    if brotli is not None:
+        encodings.insert(0, "br")
+    return ", ".join(encodings)
+
+
+def accept_compact():
+    """
+    The function `accept_compact` builds the `Accept` header value used for the weapon collection.
+    The server picks the first format it supports, plain JSON being always accepted.
+    """
+    types = [f"{COLUMNS_TYPE};q=0.9", f"{JSON_TYPE};q=0.8"]
+    if msgpack is not None:
+        types.insert(0, MSGPACK_TYPE)
+    return ", ".join(types)
+
+
+def weapons_from_columns(columns):
+    """
+    The function `weapons_from_columns` builds `Weapon` objects in bulk from a column-oriented
+    payload, where every key is sent once with the list of its values.
+
+    :param columns: A dictionary mapping each key of `WEAPON_FIELDS` to the list of its values.
+    The 'images' column is optional.
+    :return: The list of `Weapon` objects, in the order of the rows.
+    """
+    count = len(columns["id"])
+    return list(map(Weapon, *(columns.get(field) or [None] * count for field in WEAPON_FIELDS)))
+
+
+def weapons_from_records(records):
+    """
+    The function `weapons_from_records` builds `Weapon` objects from a list of weapon dictionaries,
+    which is the default JSON array sent by the server.
+    """
+    return [Weapon(record['id'], record['name'], record['type'],
+                   record['manufacturer'], record['caliber'],
+                   record['magazineCapacity'], record['fireRate'],
+                   record['ammoCount'], record.get('images')) for record in records]
+
+
+def decode_weapons(content, content_type):
+    """
+    The function `decode_weapons` decodes a weapon collection body according to the content type
+    negotiated with the server.
+
+    :param content: The raw (already decompressed) body of the response.
+    :param content_type: The `Content-Type` header of the response.
+    :return: The list of `Weapon` objects contained in the body.
+    """
+    media_type = (content_type or JSON_TYPE).split(";")[0].strip().lower()
+    if media_type == MSGPACK_TYPE:
+        if msgpack is None:
+            raise ValueError("Received a MessagePack body but msgpack is not installed")
+        payload = msgpack.unpackb(content, raw=False)
+    else:
+        payload = json.loads(content)
+    if isinstance(payload, dict):
+        return weapons_from_columns(payload)
+    return weapons_from_records(payload)
+
+
+def encode_records(weapons):
+    """
+    The function `encode_records` converts weapons to the list of dictionaries sent by the server.
+    """
+    return [dict(zip(WEAPON_FIELDS, (weapon.Id, weapon.Name, weapon.Type, weapon.Manufacturer,
+                                     weapon.Caliber, weapon.MagazineCapacity, weapon.FireRate,
+                                     weapon.AmmoCount, weapon.Images))) for weapon in weapons]
+
+
+def encode_columns(weapons):
+    """
+    The function `encode_columns` converts weapons to the column-oriented payload, with every key
+    sent once.
+    """
+    return {
+        "id": [weapon.Id for weapon in weapons],
+        "name": [weapon.Name for weapon in weapons],
+        "type": [weapon.Type for weapon in weapons],
+        "manufacturer": [weapon.Manufacturer for weapon in weapons],
+        "caliber": [weapon.Caliber for weapon in weapons],
+        "magazineCapacity": [weapon.MagazineCapacity for weapon in weapons],
+        "fireRate": [weapon.FireRate for weapon in weapons],
+        "ammoCount": [weapon.AmmoCount for weapon in weapons],
+        "images": [weapon.Images for weapon in weapons],
+    }
+
+
+def compress(content, encoding):
+    """
+    The function `compress` compresses a body with a `Content-Encoding` ('identity', 'gzip' or 'br').
+    """
+    if encoding == "gzip":
+        return gzip.compress(content)
+    if encoding == "br":
+        return brotli.compress(content)
+    return content
+
+
+def decompress(content, encoding):
+    """
+    The function `decompress` reverses `compress`. The HTTP client does it transparently, this is
+    only needed when bodies are handled outside of `requests`.
+    """
+    if encoding == "gzip":
+        return gzip.decompress(content)
+    if encoding == "br":
+        return brotli.decompress(content)
+    return content